@@ -0,0 +1,780 @@
+"""
+A module with benchmarks for the slow parts of the pipeline. They run offline, on the data checked into this folder.
+
+Run it as a script, e.g. `python benchmark.py cleaning`, to print the timings. `python benchmark.py suite` times the
+scraping entry points end to end on replayed fixture pages (see fetch's fixture modes): real ones recorded with
+`--record` (which needs the network once), or pages made up from the checked-in dataset when there are none. Save a run
+with `--save baseline.json` and compare later runs to it with `--baseline baseline.json` to catch regressions.
+
+Functions:
+    raw_game_log(features, season):
+        rebuilds a raw gamelog table (as read off the page) from a row of a generated dataset
+
+    bench_cleaning(name='2014_mpg15_g30_playerlist_data', players=None, repeat=3):
+        times the row-by-row game-log cleaning against the vectorized one, per player
+
+    game_log_html(raw):
+        renders a raw gamelog table as the widget page it came from
+
+    bench_parsing(cache_dir=None, name='2014_mpg15_g30_playerlist_data', players=None, repeat=3):
+        times BeautifulSoup + read_html against the single-pass lxml reader on saved widget pages
+
+    build_fixture_cache(cache_dir, name='2014_mpg15_g30_playerlist_data', players=None, season=2014):
+        fills an http cache with the pages needed to rebuild a checked-in dataset offline
+
+    bench_scaling(processes=(1, 2, 4), name='2014_mpg15_g30_playerlist_data', players=None, season=2014):
+        times building a season from a fixture cache with more and more worker processes
+
+    mojibake(name):
+        garbles a name the way utf-8 read as windows-1252 does
+
+    bench_names(name='2000-2019_mpg15_g30_playerlist', repeat=3):
+        checks name cleaning on the 2000-2019 player list and accented names, and times it against the chained replaces
+
+    record_fixtures(directory=fetch.FIXTURE_DIR, season=2019, players=10, team=None):
+        records the real pages the suite needs as fixtures
+
+    check_all_stars(season=2014, name='2014_mpg15_g30_playerlist', dataset='2014_mpg15_g30_playerlist_data'):
+        checks the all-star labels from the game page against the per-player pages the checked-in dataset was labeled with
+
+    bench_suite(fixtures=None, rounds=5, baseline=None, save=None, tolerance=1.25):
+        times get_roster_stats, get_game_logs, get_pre_allstar_data, get_player_names and a small gen_d on replayed fixtures
+
+    bench_memory(name='2014_mpg15_g30_playerlist_data', players=None, season=2014):
+        measures the memory of the compact gamelog pages and features against the object columns they replaced
+
+    import_time(module):
+        measures what importing a module costs in a fresh interpreter, and everything it imports
+
+    bench_imports(modules=IMPORT_MODULES, repeat=3):
+        times importing every module of the project, and checks none of them pulls in tensorflow, bs4 or tabloo for nothing
+
+Todo:
+    * more benchmarks as more of the pipeline gets optimized
+    * record a real season into fixtures/ (--record, needs the network) and check it in
+"""
+import argparse
+import glob
+import json
+import os
+import pickle
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+import fetch
+import generate_data
+import gamelogs
+import generate_players
+import tables
+import utils
+
+from bs4 import BeautifulSoup
+from generate_data import FEATURE_COLUMNS
+
+RAW_COLUMNS = ['Rk', 'G', 'Date', 'Age', 'Tm', 'Unnamed: 5', 'Opp', 'Unnamed: 7', 'GS', 'MP', 'FG', 'FGA', 'FG%', '3P', '3PA', '3P%', 'FT', 'FTA', 'FT%', 'ORB', 'DRB', 'TRB', 'AST', 'STL', 'BLK', 'TOV', 'PF', 'PTS', 'GmSc', '+/-']
+
+
+def _timeit(fn, repeat):
+    """Function to time fn, returning the best of `repeat` runs in seconds and the last result."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def _pct(made, attempted):
+    return np.nan if attempted == 0 else f'{made/attempted:.3f}'.lstrip('0')
+
+
+def raw_game_log(features, season):
+    """
+    Will rebuild the raw gamelog table a player-season's features were made from, so cleaning can be benchmarked without the network. Games where the player did nothing at all are written as 'Inactive' rows, like on the site.
+
+    Args:
+        features (array): flattened row of 690 features (30 games x FEATURE_COLUMNS)
+        season (int): season the games are from
+
+    Returns:
+        dataframe with the columns and string values pd.read_html gives for a gamelog page
+    """
+    games = pd.DataFrame(np.reshape(features, (-1, len(FEATURE_COLUMNS))), columns=FEATURE_COLUMNS)
+    first_game = pd.Timestamp(f'{season-1}-10-29')
+    rows = []
+    played = 0
+    for i, game in games.iterrows():
+        years = int(game['AGE'])
+        info = [str(i+1), None, str((first_game + pd.Timedelta(days=2*i)).date()), f'{years}-{int(round((game["AGE"]-years)*365)):03d}', 'LAL',
+                np.nan if game['HOME'] else '@', 'BOS', f'{"W" if game["RESULT"] else "L"} ({int(game["MOV"]):+d})']
+        stats = game.drop(['AGE', 'HOME', 'RESULT', 'MOV'])
+        if not stats.any():
+            info[1] = np.nan
+            rows.append(info + ['Inactive']*(len(RAW_COLUMNS)-len(info)))
+            continue
+        played += 1
+        info[1] = str(played)
+        minutes = int(game['MP'])
+        fg, fga = int(game['2P'] + game['3P']), int(game['2PA'] + game['3PA'])
+        rows.append(info + [str(int(game['GS'])), f'{minutes}:{int(round((game["MP"]-minutes)*60)):02d}', str(fg), str(fga), _pct(fg, fga),
+                            str(int(game['3P'])), str(int(game['3PA'])), _pct(game['3P'], game['3PA']), str(int(game['FT'])), str(int(game['FTA'])),
+                            _pct(game['FT'], game['FTA']), str(int(game['ORB'])), str(int(game['DRB'])), str(int(game['ORB'] + game['DRB'])),
+                            str(int(game['AST'])), str(int(game['STL'])), str(int(game['BLK'])), str(int(game['TOV'])), str(int(game['PF'])),
+                            str(int(2*game['2P'] + 3*game['3P'] + game['FT'])), '10.0', str(int(game['+/-']))])
+    return pd.DataFrame(rows, columns=RAW_COLUMNS)
+
+
+def _legacy_clean_game_log(df, start_date_str, end_date_str):
+    """The row-by-row cleaning get_game_logs used to do, kept to measure against."""
+    df = df.copy()
+    df.rename(columns = {'Date': 'DATE', 'Age': 'AGE', 'Tm': 'TEAM', 'Unnamed: 5': 'HOME/AWAY', 'Opp': 'OPPONENT','Unnamed: 7': 'RESULT', 'GmSc': 'GAME_SCORE'}, inplace=True)
+    df['HOME/AWAY'] = df['HOME/AWAY'].apply(lambda x: 'AWAY' if x=='@' else 'HOME')
+    df = df[df['Rk']!='Rk']
+    df = df.loc[(df['DATE'] >= start_date_str) & (df['DATE'] <= end_date_str)]
+    active_df = pd.DataFrame(columns = list(df.columns))
+    for index, row in df.iterrows():
+        if len(row['GS'])>1:
+            empty_game = pd.DataFrame([[row['Rk'], row['G'], row['DATE'], row['AGE'], row['TEAM'], row['HOME/AWAY'], row['OPPONENT'], row['RESULT'], 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0]])
+            empty_game.columns = list(df.columns)
+            active_df = pd.concat([active_df, empty_game]) #DataFrame.append was a concat of one row
+            continue
+        active_df = pd.concat([active_df, row.to_frame().T])
+    return active_df[(active_df['Rk'].astype(int) <= 30)]
+
+
+def _legacy_featurize(df):
+    """The column-by-column apply cleaning get_pre_allstar_data used to do, kept to measure against."""
+    def min_sec_to_frac_mins(st):
+        if st == 0: return 0
+        lst = st.split(':')
+        return round(int(lst[0]) + int(lst[1])/60,3)
+    def yr_day_to_frac_yrs(st):
+        lst = st.split('-')
+        return round(int(lst[0]) + int(lst[1])/365,3)
+    df = df.rename(columns={'HOME/AWAY': "HOME", "Rk" : 'NUM_GAME'})
+    df = df.astype({"FG": int,"FGA": int, "3P": int, "3PA": int, "FG%": float, "3P%": float, "FT": int, "FTA": int, "FT%": float, "ORB": int, "AST": int, "STL": int, "BLK": int, "TOV": int, "PF": int, "+/-": int, 'NUM_GAME': int})
+    df['2P'] = df['FG'] - df['3P']
+    df['2PA'] = df['FGA'] - df['3PA']
+    df['2P%'] = np.where(np.array(df['2PA'] == 0), 0, round(df['2P']/df['2PA'],3))
+    df['3P%'] = np.where(np.isnan(df['3P%']), 0, df['3P%'])
+    df['FT%'] = np.where(np.isnan(df['FT%']), 0, df['FT%'])
+    df2 = df['RESULT'].str.split(" ",expand=True)
+    df2.columns = ['RESULT','MOV']
+    df = df2.combine_first(df)
+    for col in ['DATE', 'TEAM', 'OPPONENT', 'GAME_SCORE', 'FG', 'FGA', 'FG%', 'TRB', 'PTS', 'NUM_GAME', 'G']:
+        del df[col]
+    df.reset_index(drop=True, inplace=True)
+    df['HOME'] = df['HOME'].replace(('HOME', 'AWAY'), (1,0))
+    df['RESULT'] = df['RESULT'].replace(('W', 'L'), (1,0))
+    df['MP'] = df['MP'].apply(min_sec_to_frac_mins)
+    df['AGE'] = df['AGE'].apply(yr_day_to_frac_yrs)
+    df['MOV'] = df['MOV'].apply(lambda x : int(x[1:-1]))
+    return df
+
+
+def bench_cleaning(name='2014_mpg15_g30_playerlist_data', players=None, repeat=3, season=2014):
+    """
+    Will time cleaning + featurizing one player-season's gamelogs the old row-by-row way and the vectorized way, on raw tables rebuilt from a checked-in dataset, and check both give the same features.
+
+    Args:
+        name (str): dataset pickle to rebuild the gamelogs from
+        players (int): only use the first `players` rows, all of them by default
+        repeat (int): runs per player, the best one counts
+        season (int): season the dataset is from
+
+    Returns:
+        dictionary with the mean seconds per player for both ways and the speedup
+    """
+    data = pd.read_pickle(name)
+    features = data.drop(columns=['target']).to_numpy()[:players]
+    start_date, end_date = f'{season-1}-08-01', f'{season}-02-20'
+    legacy_total, vectorized_total = 0.0, 0.0
+    for row in features:
+        raw = raw_game_log(row, season)
+        legacy_time, legacy = _timeit(lambda: _legacy_featurize(_legacy_clean_game_log(raw, start_date, end_date)), repeat)
+        def vectorized_run():
+            df = generate_data.clean_game_log(raw, start_date, end_date)
+            return generate_data.featurize_game_log(df[df['Rk'].astype(int) <= 30])
+        vectorized_time, vectorized = _timeit(vectorized_run, repeat)
+        if not np.array_equal(np.array(legacy, dtype=float).astype(np.float32), vectorized.to_numpy()): #the features are float32 now, like the datasets
+            raise AssertionError('vectorized cleaning gives different features than the legacy one')
+        legacy_total += legacy_time
+        vectorized_total += vectorized_time
+    n = len(features)
+    result = {'players': n, 'legacy_s_per_player': legacy_total/n, 'vectorized_s_per_player': vectorized_total/n, 'speedup': legacy_total/vectorized_total}
+    print(f'cleaning, {n} players: legacy {1000*legacy_total/n:.2f} ms/player, vectorized {1000*vectorized_total/n:.2f} ms/player, {result["speedup"]:.1f}x')
+    return result
+
+
+def game_log_html(raw):
+    """
+    Will render a raw gamelog table (see raw_game_log) as the widget page it would have been read from: empty headers and cells for NaN, 'Inactive' games as one cell spanning every stat column, and the header repeated every 20 rows like on the site.
+
+    Args:
+        raw (DataFrame): raw gamelog table
+
+    Returns:
+        page as bytes
+    """
+    def cell(value):
+        return '' if value is None or (isinstance(value, float) and np.isnan(value)) else value
+    header = '<tr>' + ''.join(f'<th>{"" if col.startswith("Unnamed") else col}</th>' for col in raw.columns) + '</tr>'
+    body = []
+    for i, row in enumerate(raw.itertuples(index=False)):
+        if i and i % 20 == 0:
+            body.append(header.replace('<tr>', '<tr class="thead">'))
+        if row[8] == 'Inactive':
+            body.append('<tr>' + ''.join(f'<td>{cell(value)}</td>' for value in row[:8]) + f'<td colspan="{len(row)-8}">Inactive</td></tr>')
+        else:
+            body.append('<tr>' + ''.join(f'<td>{cell(value)}</td>' for value in row) + '</tr>')
+    return f'<div class="table_container"><table id="pgl_basic"><thead>{header}</thead><tbody>{"".join(body)}</tbody></table></div>'.encode()
+
+
+def _fixture_pages(cache_dir, name, players, season):
+    """Function to get the widget pages to parse: every cached one in cache_dir, or if there are none, gamelog pages rebuilt from a checked-in dataset."""
+    pages = []
+    for path in sorted(glob.glob(os.path.join(cache_dir or fetch.CACHE_DIR, '*.p'))):
+        with open(path, 'rb') as fp:
+            response = pickle.load(fp)
+        if 'wg.fcgi' in response.url and response.status_code == 200 and b'<table' in response.content:
+            pages.append(response.content)
+    if pages:
+        return pages[:players]
+    features = pd.read_pickle(name).drop(columns=['target']).to_numpy()[:players]
+    return [game_log_html(raw_game_log(row, season)) for row in features]
+
+
+def _legacy_read_table(content):
+    """The BeautifulSoup + str(table) + read_html parse the scrapers used to do, plus the header row drop and type inference the callers did after it, kept to measure against."""
+    soup = BeautifulSoup(content, 'html.parser')
+    df = pd.read_html(str(soup.find('table')))[0]
+    df = df[df['Rk']!='Rk'].reset_index(drop=True)
+    return df.apply(lambda col: pd.to_numeric(col, errors='ignore'))
+
+
+def bench_parsing(cache_dir=None, name='2014_mpg15_g30_playerlist_data', players=None, repeat=3, season=2014):
+    """
+    Will time reading the table off saved widget pages the old way (BeautifulSoup, then read_html on the re-serialized table) and with tables.read_table, and check both give the same dataframe.
+
+    Args:
+        cache_dir (str): http cache to take the pages from, fetch.CACHE_DIR by default. When it has no widget pages, gamelog pages are rebuilt from the dataset instead.
+        name (str): dataset pickle to rebuild gamelog pages from
+        players (int): only use the first `players` pages, all of them by default
+        repeat (int): runs per page, the best one counts
+        season (int): season the dataset is from
+
+    Returns:
+        dictionary with the mean seconds per page for both ways and the speedup
+    """
+    pages = _fixture_pages(cache_dir, name, players, season)
+    legacy_total, lxml_total = 0.0, 0.0
+    for content in pages:
+        legacy_time, legacy = _timeit(lambda: _legacy_read_table(content), repeat)
+        lxml_time, parsed = _timeit(lambda: tables.read_table(content), repeat)
+        pd.testing.assert_frame_equal(legacy, parsed)
+        legacy_total += legacy_time
+        lxml_total += lxml_time
+    n = len(pages)
+    result = {'pages': n, 'legacy_s_per_page': legacy_total/n, 'lxml_s_per_page': lxml_total/n, 'speedup': legacy_total/lxml_total}
+    print(f'parsing, {n} pages: BeautifulSoup + read_html {1000*legacy_total/n:.2f} ms/page, lxml {1000*lxml_total/n:.2f} ms/page, {result["speedup"]:.1f}x')
+    return result
+
+
+def build_fixture_cache(cache_dir, name='2014_mpg15_g30_playerlist_data', players=None, season=2014):
+    """
+    Will fill an http cache (or a fixture folder, same format) with made-up but consistent pages for every row of a checked-in dataset: a player index, one gamelog page per player (rebuilt from their features), the league's per-game table (everyone on LAL, qualifying), every player's all-star table and the all-star game roster, so a season can be built offline and compared with the dataset. A fixtures.json manifest of what's in there is written next to the pages.
+
+    Args:
+        cache_dir (str): http cache to write into
+        name (str): dataset pickle the pages are made from
+        players (int): only use the first `players` rows, all of them by default
+        season (int): season the dataset is from
+
+    Returns:
+        list of the made-up player names, in the order of the dataset rows
+    """
+    data = pd.read_pickle(name)
+    features = data.drop(columns=['target']).to_numpy()[:players]
+    targets = data['target'].to_numpy()[:players]
+    cache = fetch.ResponseCache(cache_dir, ttl=None)
+    names, letters, stars = [], {}, []
+    for i, (row, target) in enumerate(zip(features, targets)):
+        name = f'Player{i:03d} Fixture'
+        suffix = f'/players/f/fixtu{i:03d}.html'
+        names.append(name)
+        letters.setdefault('f', []).append(f'<tr><th data-stat="player"><a href="{suffix}">{name}</a></th><td data-stat="year_min">{season-1}</td><td data-stat="year_max">{season+1}</td></tr>')
+        if target == 1:
+            stars.append(f'<tr><th data-stat="player"><a href="{suffix}">{name}</a></th><td data-stat="mp">20:00</td></tr>')
+        selections = f'<table id="all_star"><thead><tr><th>Season</th><th>Conf</th></tr></thead><tbody><tr><th>{season-1}-{str(season)[-2:]}</th><td>East</td></tr></tbody></table>' if target == 1 else ''
+        cache.store(fetch.Response(f'https://widgets.sports-reference.com/wg.fcgi?css=1&site=bbr&url=%2Fplayers%2Ff%2Ffixtu{i:03d}.html&div=div_all_star', 200, f'<div>{selections}</div>'.encode()))
+        encoded = suffix.replace('/', '%2F').replace('.html', '')
+        cache.store(fetch.Response(f'https://widgets.sports-reference.com/wg.fcgi?css=1&site=bbr&url={encoded}%2Fgamelog%2F{season}&div=div_pgl_basic', 200, game_log_html(raw_game_log(row, season))))
+    for letter in utils.PLAYER_INDEX_LETTERS:
+        cache.store(fetch.Response(f'https://www.basketball-reference.com/players/{letter}', 200, f'<table id="players"><tbody>{"".join(letters.get(letter, []))}</tbody></table>'.encode()))
+    #two box scores, the last star sitting out, and a contest table of non all-stars that must not count
+    contest = ''.join(f'<tr><th data-stat="player"><a href="/players/f/fixtu{i:03d}.html">x</a></th><td data-stat="pts">20</td></tr>' for i, target in enumerate(targets) if target == 0)
+    if stars:
+        stars[-1] = stars[-1].replace('<td data-stat="mp">20:00</td>', '<td data-stat="reason">Did Not Play</td>')
+    box = '<thead><tr><th data-stat="player">Starters</th><th data-stat="mp">MP</th></tr></thead>'
+    half = len(stars)//2
+    cache.store(fetch.Response(f'https://www.basketball-reference.com/allstar/NBA_{season}.html', 200,
+                               (f'<table id="East">{box}<tbody>{"".join(stars[:half])}</tbody></table>'
+                                f'<!--<table id="West">{box}<tbody>{"".join(stars[half:])}</tbody></table>--><!--<table id="three_point"><tbody>{contest}</tbody></table>-->').encode()))
+    header = ''.join(f'<th>{col}</th>' for col in ('Rk', 'Player', 'Pos', 'Age', 'Tm', 'G', 'GS', 'MP'))
+    rows = ''.join(f'<tr><th>{i+1}</th><td>{name}</td><td>SF</td><td>25</td><td>LAL</td><td>40</td><td>10</td><td>25.0</td></tr>' for i, name in enumerate(names))
+    cache.store(fetch.Response(f'https://widgets.sports-reference.com/wg.fcgi?css=1&site=bbr&url=%2Fleagues%2FNBA_{season}_per_game.html&div=div_per_game_stats', 200,
+                               f'<table id="per_game_stats"><thead><tr>{header}</tr></thead><tbody>{rows}</tbody></table>'.encode()))
+    with open(os.path.join(cache_dir, 'fixtures.json'), 'w') as fp:
+        json.dump({'season': season, 'team': 'LAL', 'players': names, 'made_up': True}, fp, indent=1)
+    return names
+
+
+def bench_scaling(processes=(1, 2, 4), name='2014_mpg15_g30_playerlist_data', players=None, season=2014):
+    """
+    Will time building one season from a fixture cache (see build_fixture_cache) with threads and with more and more worker processes, offline and from scratch every time. Every build has to give the same bytes as the first one, and match the checked-in dataset (up to the last digit of the percentages, which the rebuilt pages round their own way).
+
+    Args:
+        processes (tuple): worker process counts to try, 1 means the thread path
+        name (str): dataset pickle the fixture is made from
+        players (int): only use the first `players` rows, all of them by default
+        season (int): season the dataset is from
+
+    Returns:
+        dictionary of processes -> seconds for the whole build
+    """
+    expected = pd.read_pickle(name).to_numpy(dtype=np.float32)[:players]
+    name = os.path.abspath(name)
+    cwd, previous = os.getcwd(), fetch.settings()
+    result = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            players = build_fixture_cache(os.path.join(tmp, 'cache'), name, players, season)
+            fetch.configure(cache_dir=os.path.join(tmp, 'cache'), ttl=float('inf'), offline=True)
+            for n in processes:
+                for file in glob.glob(os.path.join(tmp, utils.PARTITION_DIR, '*')):
+                    os.remove(file)
+                generate_data.gamelogs.store = generate_data.gamelogs.GameLogStore()
+                start = time.perf_counter()
+                matrices, problems = generate_data.gen_seasons({season: set(players)}, workers=1, processes=n)
+                result[n] = time.perf_counter() - start
+                if n == processes[0]:
+                    first = matrices[season].tobytes()
+                    if not np.allclose(matrices[season], expected, rtol=0, atol=1.5e-3):
+                        raise AssertionError('the build differs from the dataset')
+                elif matrices[season].tobytes() != first:
+                    raise AssertionError(f'the build with {n} processes differs from the one with {processes[0]}')
+                print(f'scaling, {len(players)} players: {n} process{"es" if n > 1 else ""} {result[n]:.2f} s, {result[processes[0]]/result[n]:.2f}x')
+        finally:
+            os.chdir(cwd)
+            fetch.configure(**previous)
+    return result
+
+
+ACCENTED_NAMES = {
+    'Manu Ginóbili': 'Manu Ginobili', 'Dario Šarić': 'Dario Saric', 'Ante Žižić': 'Ante Zizic', 'Ersan İlyasova': 'Ersan Ilyasova',
+    'Óscar Torres': 'Oscar Torres', 'Nenê': 'Nene', 'Goran Dragić': 'Goran Dragic', 'Nikola Jokić': 'Nikola Jokic',
+    'Jonas Valančiūnas': 'Jonas Valanciunas', 'Kristaps Porziņģis': 'Kristaps Porzingis', 'Hedo Türkoğlu': 'Hedo Turkoglu',
+    'José Calderón': 'Jose Calderon', 'Bojan Bogdanović': 'Bojan Bogdanovic', 'Nikola Vučević': 'Nikola Vucevic',
+    'Jusuf Nurkić': 'Jusuf Nurkic', 'Tomáš Satoranský': 'Tomas Satoransky', 'Mirza Teletović': 'Mirza Teletovic',
+    'Dennis Schröder': 'Dennis Schroder', 'Ömer Aşık': 'Omer Asik', 'Anderson Varejão': 'Anderson Varejao',
+    'Peja Stojaković': 'Peja Stojakovic', 'Raül López': 'Raul Lopez', 'Žarko Čabarkapa': 'Zarko Cabarkapa',
+    'Gustavo Ayón': 'Gustavo Ayon', 'Nenad Krstić': 'Nenad Krstic', 'Darko Miličić': 'Darko Milicic',
+    'Dāvis Bertāns': 'Davis Bertans', 'Sergio Rodríguez': 'Sergio Rodriguez', 'Álex Abrines': 'Alex Abrines',
+    'Juan Carlos Navarro': 'JuanCarlos Navarro', 'Hakeem Olajuwon*': 'Hakeem Olajuwon',
+}
+#names the chained replaces left garbled in the 2000-2019 player list ('Ante zizic' and co. lost a capital, which can't be told apart anymore)
+LEGACY_NAME_BUGS = {'Ã“scar Torres': 'Oscar Torres'}
+
+
+def mojibake(name):
+    """Function to garble a name the way utf-8 decoded as windows-1252 does, bytes 1252 doesn't define becoming latin-1 control characters."""
+    return ''.join(bytes([byte]).decode('cp1252', errors='ignore') or chr(byte) for byte in name.encode('utf-8'))
+
+
+def _legacy_prune_weird_names(st):
+    """The chained replaces utils.prune_weird_names used to do, kept to measure against."""
+    st = st.replace('Ã–', 'o')
+    st = st.replace('Å½', 'z')
+    st = st.replace('Å¾', 'z')
+    st = st.replace('Å†', 'n')
+    st = st.replace('Ä£', 'g')
+    st = st.replace('*', '')
+    st = st.replace('Juan Carlos Navarro', 'JuanCarlos Navarro')
+    st = st.replace('Ã©', 'e')
+    st = st.replace('Ã¡', 'a')
+    st = st.replace('Ä‡', 'c')
+    st = st.replace('Ä', 'c')
+    st = st.replace('Ã¼', 'u')
+    st = st.replace('ÄŸ', 'g')
+    st = st.replace('Ã³', 'o')
+    st = st.replace('Ã¶', 'o')
+    st = st.replace('Ã¤', 'a')
+    st = st.replace('Ãª', 'e')
+    st = st.replace('Å™', 'r')
+    st = st.replace('Ã­-', 'o')
+    st = st.replace('Ã£', 'a')
+    st = st.replace('Ã«', 'e')
+    st = st.replace('Å¡', 's')
+    st = st.replace('Å ', 's')
+    st = st.replace('Å«', 'u')
+    st = st.replace('Ä°', 'i')
+    st = st.replace('Ã½', 'y')
+    st = st.replace('ÅŸ', 's')
+    st = st.replace('Ä±', 'i')
+    st = st.replace('Ã§', 'c')
+    st = st.replace('Ã', 'a' )
+    st = st.replace('Ã­', 'i')
+    st = st.replace('Ã¨', 'e')
+    st = st.replace('Ä', 'a')
+    st = st.replace('Å½iÅ¾iÄ‡', 'Zizic')
+    return st
+
+
+def bench_names(name='2000-2019_mpg15_g30_playerlist', repeat=3):
+    """
+    Will check utils.prune_weird_names: every name of a player list comes out unchanged (except the ones the chained replaces left garbled, which come out fixed), and accented names come out folded whether they arrive clean, as mojibake, or as mojibake with the no-break spaces lost. Then times cleaning every roster row of the list plus the mojibake names (one of each per season) with the chained replaces, with the new function and with the cached Series variant.
+
+    Args:
+        name (str): player list to check, as saved by generate_players.gen_p
+        repeat (int): runs, the best one counts
+
+    Returns:
+        dictionary with the seconds per name for every way, and how many names the chained replaces get wrong
+    """
+    seasons = utils.load_dict(name)
+    for player in set().union(*seasons.values()):
+        cleaned = utils.prune_weird_names(player)
+        if cleaned != LEGACY_NAME_BUGS.get(player, player):
+            raise AssertionError(f'{player!r} was cleaned to {cleaned!r}')
+    garbled = {}
+    for accented, expected in ACCENTED_NAMES.items():
+        for variant in (accented, mojibake(accented), mojibake(accented).replace('\xa0', ' ')):
+            if utils.prune_weird_names(variant) != expected:
+                raise AssertionError(f'{variant!r} was cleaned to {utils.prune_weird_names(variant)!r}, expected {expected!r}')
+            garbled[variant] = expected
+    legacy_wrong = sum(_legacy_prune_weird_names(variant) != expected for variant, expected in garbled.items())
+    names = pd.Series([player for players in seasons.values() for player in sorted(players)] + list(garbled)*len(seasons))
+    def new_uncached():
+        return names.map(utils.prune_weird_names.__wrapped__)
+    def new_series():
+        utils.prune_weird_names.cache_clear()
+        return utils.prune_weird_names_series(names)
+    legacy_time, legacy = _timeit(lambda: names.map(_legacy_prune_weird_names), repeat)
+    uncached_time, uncached = _timeit(new_uncached, repeat)
+    series_time, series = _timeit(new_series, repeat)
+    if not series.equals(uncached):
+        raise AssertionError('prune_weird_names_series differs from prune_weird_names')
+    n = len(names)
+    result = {'names': n, 'legacy_s_per_name': legacy_time/n, 'single_pass_s_per_name': uncached_time/n, 'series_s_per_name': series_time/n,
+              'legacy_wrong': legacy_wrong, 'garbled': len(garbled)}
+    print(f'names, {n} rows: chained replaces {1e6*legacy_time/n:.2f} us/name ({legacy_wrong}/{len(garbled)} accented variants wrong), '
+          f'single pass {1e6*uncached_time/n:.2f} us/name, cached series {1e6*series_time/n:.2f} us/name, {legacy_time/series_time:.1f}x')
+    return result
+
+
+def record_fixtures(directory=fetch.FIXTURE_DIR, season=2019, players=10, team=None):
+    """
+    Will record, as fixtures, every real page the suite needs for a season: the league's per-game table, the all-star game page, the player index and the gamelogs and all-star tables of a few qualifying players. Needs the network (or an http cache that already has the pages). A fixtures.json manifest of what was recorded is written next to them. Check the folder in, test_all_stars.test_recorded_season and the suite replay it.
+
+    Args:
+        directory (str): fixture folder to record into
+        season (int): season to record
+        players (int): how many qualifying players to record the gamelogs of, the first ones by name
+        team (str): team for get_roster_stats, the team of the first recorded player by default
+
+    Returns:
+        the manifest
+    """
+    previous = fetch.settings()
+    fetch.configure(fixtures=directory, fixture_mode='record')
+    try:
+        names = sorted(generate_players.get_player_names(season, season, workers=1)[season])[:players]
+        if team is None:
+            stats = generate_players.get_season_stats(season)
+            team = stats.loc[stats['PLAYER'] == names[0], 'TEAM'].iloc[0]
+        generate_players.get_roster_stats(team, season)
+        utils.get_all_stars(season, season)
+        for name in names:
+            generate_data.get_pre_allstar_data(name, season)
+        utils.all_star_labels([utils.get_player_suffix(name, season) for name in names], season, 'player_pages', workers=1)
+    finally:
+        fetch.configure(**previous)
+    manifest = {'season': season, 'team': team, 'players': names, 'made_up': False, 'recorded': time.strftime('%Y-%m-%d %H:%M:%S')}
+    with open(os.path.join(directory, 'fixtures.json'), 'w') as fp:
+        json.dump(manifest, fp, indent=1)
+    return manifest
+
+
+def check_all_stars(season=2014, name='2014_mpg15_g30_playerlist', dataset='2014_mpg15_g30_playerlist_data'):
+    """
+    Will check the all-star labels read off the all-star game page against the per-player pages the checked-in dataset was labeled with, for every player of a checked-in player list. Needs the real pages: the network, an http cache or fixtures recorded with --record (the made-up fixture pages only agree with themselves). The game page should only become utils.ALL_STAR_SOURCE once this finds no mismatches.
+
+    Args:
+        season (int): season to check
+        name (str): player list pickle the dataset was built from
+        dataset (str): dataset pickle built from it, its number of all-stars is printed next to the others
+
+    Returns:
+        dictionary with the number of all-stars each way and the players they disagree on
+    """
+    names = sorted(utils.load_dict(name)[season])
+    suffixes = [utils.get_player_suffix(player, season) for player in names]
+    labels = utils.all_star_labels(suffixes, season, 'game_page')
+    legacy = utils.all_star_labels(suffixes, season, 'player_pages')
+    result = {'players': len(names), 'all_stars': sum(labels), 'legacy_all_stars': sum(legacy), 'dataset_all_stars': int(pd.read_pickle(dataset)['target'].sum()),
+              'mismatches': [(player, label, old) for player, label, old in zip(names, labels, legacy) if label != old]}
+    print(f'all-stars {season}, {len(names)} players: {result["all_stars"]} from the game page, {result["legacy_all_stars"]} from the player pages, {result["dataset_all_stars"]} in {dataset}')
+    for player, label, old in result['mismatches']:
+        print(f'  {player}: game page {label}, player page {old}')
+    return result
+
+
+def _cold():
+    """Function to drop every in-memory cache, so every round parses the pages again instead of timing a dictionary lookup."""
+    generate_players._season_stats.clear()
+    utils._all_star_seasons.clear()
+    utils._player_index = None
+    utils._letters_refreshed.clear()
+    utils.prune_weird_names.cache_clear()
+    generate_data.gamelogs.store = generate_data.gamelogs.GameLogStore()
+
+
+def _clear_directory(directory):
+    for entry in os.scandir(directory):
+        if entry.is_dir():
+            shutil.rmtree(entry.path)
+        else:
+            os.remove(entry.path)
+
+
+def _stats(times):
+    times = np.array(times)
+    return {'rounds': len(times), 'min_s': float(times.min()), 'max_s': float(times.max()), 'mean_s': float(times.mean()),
+            'median_s': float(np.median(times)), 'stddev_s': float(times.std(ddof=1)) if len(times) > 1 else 0.0}
+
+
+def bench_suite(fixtures=None, rounds=5, baseline=None, save=None, tolerance=1.25):
+    """
+    Will time the scraping entry points on replayed fixture pages, the way pytest-benchmark does: a warmup round, then `rounds` timed rounds, each one from cold in-memory caches and in an empty working directory. Nothing touches the network, so runs are comparable across machines states and commits.
+
+    Benchmarks: roster_stats (get_roster_stats), player_names (get_player_names), game_logs (get_game_logs of every fixture player), pre_allstar_data (get_pre_allstar_data of every fixture player) and gen_d (the whole season built from scratch).
+
+    Args:
+        fixtures (str): fixture folder with a fixtures.json manifest (see record_fixtures). If None, or if it has no manifest, pages made up from the checked-in 2014 dataset (20 players) are used.
+        rounds (int): timed rounds per benchmark
+        baseline (str): json saved by an earlier run with save, to compare the mean times with
+        save (str): json file to save this run's results to
+        tolerance (float): a benchmark whose mean is more than this many times the baseline's counts as a regression
+
+    Returns:
+        dictionary of benchmark -> rounds, min/max/mean/median/stddev seconds (and 'vs_baseline' with a baseline)
+
+    Raises:
+        AssertionError: if a benchmark regressed compared to the baseline
+    """
+    cwd, previous = os.getcwd(), fetch.settings()
+    dataset_name = os.path.abspath('2014_mpg15_g30_playerlist_data')
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        if fixtures is None or not os.path.exists(os.path.join(fixtures, 'fixtures.json')):
+            fixtures = os.path.join(tmp, 'fixtures')
+            build_fixture_cache(fixtures, dataset_name, players=20)
+        fixtures = os.path.abspath(fixtures)
+        with open(os.path.join(fixtures, 'fixtures.json')) as fp:
+            manifest = json.load(fp)
+        season, team, players = manifest['season'], manifest['team'], manifest['players']
+        start_date, end_date = generate_data.pre_allstar_window(season)
+        work = os.path.join(tmp, 'work')
+        os.makedirs(work)
+        os.chdir(work)
+        fetch.configure(fixtures=fixtures, fixture_mode='replay', workers=1)
+        benchmarks = {
+            'roster_stats': lambda: generate_players.get_roster_stats(team, season),
+            'player_names': lambda: generate_players.get_player_names(season, season, workers=1),
+            'game_logs': lambda: [generate_data.get_game_logs(name, start_date, end_date, season=season) for name in players],
+            'pre_allstar_data': lambda: [generate_data.get_pre_allstar_data(name, season) for name in players],
+            'gen_d': lambda: generate_data.gen_d(season, season, workers=1),
+        }
+        try:
+            for name, fn in benchmarks.items():
+                times = []
+                for i in range(rounds+1):
+                    _clear_directory(work)
+                    _cold()
+                    if name != 'gen_d':
+                        utils.player_index() #the index is built once per run, not timed except as part of gen_d
+                    start = time.perf_counter()
+                    fn()
+                    if i: #the first round is the warmup
+                        times.append(time.perf_counter() - start)
+                results[name] = _stats(times)
+        finally:
+            os.chdir(cwd)
+            fetch.configure(**previous)
+            _cold()
+    regressions = []
+    if baseline is not None:
+        with open(baseline) as fp:
+            base = json.load(fp)['results']
+        for name, result in results.items():
+            if name in base:
+                result['vs_baseline'] = result['mean_s']/base[name]['mean_s']
+                if result['vs_baseline'] > tolerance:
+                    regressions.append(name)
+    print(f'suite, {len(players)} players of {season} ({"made-up" if manifest.get("made_up") else "recorded"} fixtures), {rounds} rounds:')
+    print(f'{"name":<18}{"min ms":>10}{"mean ms":>10}{"median ms":>11}{"stddev ms":>11}{"vs baseline":>13}')
+    for name, result in results.items():
+        ratio = f'{result["vs_baseline"]:.2f}x' if 'vs_baseline' in result else ''
+        print(f'{name:<18}{1000*result["min_s"]:>10.1f}{1000*result["mean_s"]:>10.1f}{1000*result["median_s"]:>11.1f}{1000*result["stddev_s"]:>11.1f}{ratio:>13}')
+    if save is not None:
+        with open(save, 'w') as fp:
+            json.dump({'manifest': manifest, 'created': time.strftime('%Y-%m-%d %H:%M:%S'), 'results': results}, fp, indent=1)
+    if regressions:
+        raise AssertionError(f'slower than the baseline by more than {tolerance}x: {", ".join(regressions)}')
+    return results
+
+
+def _legacy_normalize_game_log(df):
+    """The cleaning gamelog pages got before they were stored compact: columns stay as read off the page (object for anything with text in it), kept to measure against."""
+    df = df.rename(columns = {'Date': 'DATE', 'Age': 'AGE', 'Tm': 'TEAM', 'Unnamed: 5': 'HOME/AWAY', 'Opp': 'OPPONENT','Unnamed: 7': 'RESULT', 'GmSc': 'GAME_SCORE'})
+    df = df[df['Rk']!='Rk'].drop(['Unnamed: 30'], axis=1, errors='ignore').copy()
+    df['HOME/AWAY'] = np.where(df['HOME/AWAY']=='@', 'AWAY', 'HOME')
+    inactive = pd.to_numeric(df['GS'], errors='coerce').isna().to_numpy()
+    stat_columns = [col for col in df.columns if col not in gamelogs.GAME_INFO_COLUMNS]
+    df.loc[inactive, stat_columns] = 0
+    return df
+
+
+def bench_memory(name='2014_mpg15_g30_playerlist_data', players=None, season=2014):
+    """
+    Will measure how much memory the gamelog pages held by gamelogs.store and the featurized games take, compact against the way they used to be kept (object columns off the page, float64 features), on pages rebuilt from a checked-in dataset and parsed like real ones. Also checks the compact pages featurize back to the dataset's rows (bench_cleaning checks they featurize exactly like the old cleaning).
+
+    Args:
+        name (str): dataset pickle to rebuild the gamelogs from
+        players (int): only use the first `players` rows, all of them by default
+        season (int): season the dataset is from
+
+    Returns:
+        dictionary with the bytes of the pages and features both ways and the reductions
+    """
+    data = pd.read_pickle(name)
+    features = data.drop(columns=['target']).to_numpy(dtype=np.float32)[:players]
+    legacy_pages, pages, legacy_features, compact_features = [], [], [], []
+    for row in features:
+        df = tables.read_table(game_log_html(raw_game_log(row, season)))
+        legacy_pages.append(_legacy_normalize_game_log(df))
+        pages.append(gamelogs.normalize_game_log(df))
+        games = generate_data.featurize_game_log(pages[-1])
+        if not np.allclose(games.to_numpy().reshape(-1), row, atol=1.5e-3): #the made-up pages round percentages to 3 digits
+            raise AssertionError('compact gamelogs give different features than the dataset')
+        compact_features.append(games)
+        legacy_features.append(games.astype(np.float64))
+    frame_bytes = gamelogs._frame_bytes
+    result = {'players': len(features), 'legacy_page_bytes': frame_bytes(legacy_pages), 'page_bytes': frame_bytes(pages),
+              'legacy_feature_bytes': frame_bytes(legacy_features), 'feature_bytes': frame_bytes(compact_features)}
+    result['page_reduction'] = result['legacy_page_bytes']/result['page_bytes']
+    result['feature_reduction'] = result['legacy_feature_bytes']/result['feature_bytes']
+    n = len(features)
+    print(f'memory, {n} players: pages {result["legacy_page_bytes"]/n/1024:.1f} KiB -> {result["page_bytes"]/n/1024:.1f} KiB per player ({result["page_reduction"]:.1f}x), '
+          f'features {result["legacy_feature_bytes"]/n/1024:.1f} KiB -> {result["feature_bytes"]/n/1024:.1f} KiB ({result["feature_reduction"]:.1f}x)')
+    return result
+
+
+IMPORT_MODULES = ('cli', 'fetch', 'utils', 'generate_players', 'generate_data', 'score', 'work')
+HEAVY_MODULES = {'tensorflow': ('work',), 'bs4': (), 'tabloo': ()} #heavy dependency -> the only modules allowed to import it
+
+
+def import_time(module):
+    """
+    Will import a module in a fresh interpreter with -X importtime, from this folder.
+
+    Args:
+        module (str): module to import
+
+    Returns:
+        (seconds the import took, set of the top-level packages it imported), or None if it can't be imported here (a missing dependency)
+    """
+    folder = os.path.dirname(os.path.abspath(__file__))
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'], cwd=folder, capture_output=True, text=True)
+    if result.returncode != 0:
+        return None
+    total, packages = None, set()
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or line.endswith('imported package'):
+            continue
+        _, cumulative, name = line.split('|')
+        packages.add(name.strip().split('.')[0])
+        if name.strip() == module and len(name) - len(name.lstrip()) == 1: #the module itself, not a submodule of the same name
+            total = int(cumulative)/1e6
+    return total, packages
+
+
+def bench_imports(modules=IMPORT_MODULES, repeat=3):
+    """
+    Will time importing every module, best of repeat fresh interpreters each, and check that none of them imports a heavy dependency (see HEAVY_MODULES) it doesn't need, and that importing cli imports nothing but the standard library.
+
+    Args:
+        modules (tuple): modules to import
+        repeat (int): fresh interpreters per module
+
+    Returns:
+        dictionary of module -> seconds, None for the ones with a missing dependency here
+    """
+    results = {}
+    for module in modules:
+        runs = [import_time(module) for _ in range(repeat)]
+        if runs[0] is None:
+            results[module] = None
+            print(f'{module:<18} can\'t be imported here, missing dependency')
+            continue
+        seconds, packages = min(run[0] for run in runs), runs[0][1]
+        for heavy, allowed in HEAVY_MODULES.items():
+            assert heavy not in packages or module in allowed, f'importing {module} imports {heavy}'
+        results[module] = seconds
+        print(f'{module:<18} {1000*seconds:8.1f} ms {len(packages):5d} packages')
+    if results.get('cli') is not None:
+        assert not {'pandas', 'numpy', 'requests', 'lxml'} & import_time('cli')[1], 'importing cli imports more than argparse'
+    return results
+
+
+BENCHMARKS = {
+    'cleaning': bench_cleaning,
+    'parsing': bench_parsing,
+    'scaling': bench_scaling,
+    'names': bench_names,
+    'suite': bench_suite,
+    'imports': bench_imports,
+    'memory': bench_memory,
+}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run the offline benchmarks.')
+    parser.add_argument('benchmarks', nargs='*', help=f'which benchmarks to run ({", ".join(BENCHMARKS)}), all of them by default')
+    parser.add_argument('--fixtures', default=None, help=f'fixture folder for the suite, e.g. {fetch.FIXTURE_DIR}')
+    parser.add_argument('--record', action='store_true', help='record real fixtures into --fixtures first, needs the network')
+    parser.add_argument('--season', type=int, default=2019, help='season to record')
+    parser.add_argument('--rounds', type=int, default=5, help='timed rounds per suite benchmark')
+    parser.add_argument('--baseline', default=None, help='json of an earlier suite run to compare with')
+    parser.add_argument('--save', default=None, help='json file to save the suite results to')
+    parser.add_argument('--check-all-stars', type=int, default=None, metavar='SEASON', help='check the all-star labels of a checked-in season against the per-player pages, needs the real pages')
+    args = parser.parse_args()
+    for bench in args.benchmarks:
+        if bench not in BENCHMARKS:
+            parser.error(f'unknown benchmark {bench}')
+    if args.record:
+        record_fixtures(args.fixtures or fetch.FIXTURE_DIR, args.season)
+    if args.check_all_stars:
+        check_all_stars(args.check_all_stars, f'{args.check_all_stars}_mpg15_g30_playerlist', f'{args.check_all_stars}_mpg15_g30_playerlist_data')
+        sys.exit()
+    for bench in args.benchmarks or BENCHMARKS:
+        if bench == 'suite':
+            bench_suite(args.fixtures or (fetch.FIXTURE_DIR if args.record else None), args.rounds, args.baseline, args.save)
+        else:
+            BENCHMARKS[bench]()
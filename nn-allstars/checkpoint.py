@@ -0,0 +1,141 @@
+"""
+A module that keeps track of which player-seasons a dataset build has already done, so a crashed or banned build can pick up where it stopped.
+
+Progress lives in a small sqlite database next to the dataset: every finished player-season is written (with its features) as
+soon as it is done, and every failure goes into a retry queue that a resumed build works through again. Only failures that
+say nothing about the player (offline, network errors, 429/5xx pages) are retried; a broken or missing gamelog is
+recorded once and not asked for again. A season isn't finished while it still has retryable failures (see pending).
+
+Classes:
+    CheckpointStore(path):
+        durable per-(season, player) progress and retry queue for one dataset build
+
+Todo:
+    * a report of the failures that ran out of attempts
+"""
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+MAX_ATTEMPTS = 3 #after this many retryable failures a player-season stays in the queue but isn't retried anymore
+
+
+class CheckpointStore:
+    """
+    Durable progress of a dataset build. Safe to use from the scraping threads, every write is committed right away.
+
+    Args:
+        path (str): sqlite file to keep the progress in, created if needed.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.execute('CREATE TABLE IF NOT EXISTS progress (season INTEGER, player TEXT, suffix TEXT, features BLOB, PRIMARY KEY (season, player))')
+        self._db.execute('CREATE TABLE IF NOT EXISTS failures (season INTEGER, player TEXT, error TEXT, attempts INTEGER, last_attempt REAL, retryable INTEGER DEFAULT 1, PRIMARY KEY (season, player))')
+        try: #progress saved before failures were told apart, all of them count as retryable
+            self._db.execute('ALTER TABLE failures ADD COLUMN retryable INTEGER DEFAULT 1')
+        except sqlite3.OperationalError:
+            pass
+        self._db.commit()
+
+    def completed(self, season):
+        """Function to get the players whose season is done, successfully or not worth retrying.
+
+        Args:
+            season (int): season to look at
+
+        Returns:
+            set of player names that don't need to be scraped again
+        """
+        with self._lock:
+            done = {row[0] for row in self._db.execute('SELECT player FROM progress WHERE season=?', (season,))}
+            done.update(row[0] for row in self._db.execute('SELECT player FROM failures WHERE season=? AND (attempts>=? OR retryable=0)', (season, MAX_ATTEMPTS)))
+        return done
+
+    def pending(self, season):
+        """Function to get the players of a season whose failure should be retried, the season isn't finished while there are any.
+
+        Args:
+            season (int): season to look at
+
+        Returns:
+            set of player names
+        """
+        with self._lock:
+            return {row[0] for row in self._db.execute('SELECT player FROM failures WHERE season=? AND retryable=1 AND attempts<?', (season, MAX_ATTEMPTS))}
+
+    def record(self, season, player, suffix, features):
+        """Function to save a finished player-season, and take it off the retry queue.
+
+        Args:
+            season (int): season of the row
+            player (str): player name
+            suffix (str): bbref suffix of the player, used for labeling
+            features (array or None): flattened features, None if the player didn't have a full window
+
+        Returns:
+            None
+        """
+        blob = None if features is None else np.asarray(features, dtype=np.float32).tobytes()
+        with self._lock:
+            self._db.execute('INSERT OR REPLACE INTO progress VALUES (?, ?, ?, ?)', (season, player, suffix, blob))
+            self._db.execute('DELETE FROM failures WHERE season=? AND player=?', (season, player))
+            self._db.commit()
+
+    def record_failure(self, season, player, error, retryable=True):
+        """Function to put a player-season on the retry queue, or bump its attempts if it already is.
+
+        Args:
+            season (int): season that failed
+            player (str): player name
+            error (str): what went wrong
+            retryable (bool): whether another attempt could work (network trouble), False when the gamelog itself is the problem
+
+        Returns:
+            None
+        """
+        with self._lock:
+            self._db.execute('INSERT INTO failures VALUES (?, ?, ?, 1, ?, ?) ON CONFLICT (season, player) DO UPDATE SET error=excluded.error, attempts=attempts+1, last_attempt=excluded.last_attempt, retryable=excluded.retryable',
+                             (season, player, error, time.time(), int(retryable)))
+            self._db.commit()
+
+    def rows(self, season, width=690):
+        """Function to get the finished rows of a season, in player order so every run assembles them the same way.
+
+        Args:
+            season (int): season to read
+            width (int): expected number of features, rows of any other length are skipped
+
+        Returns:
+            list of (player, suffix, features) tuples
+        """
+        with self._lock:
+            rows = self._db.execute('SELECT player, suffix, features FROM progress WHERE season=? AND features IS NOT NULL ORDER BY player', (season,)).fetchall()
+        rows = [(player, suffix, np.frombuffer(blob, dtype=np.float32)) for player, suffix, blob in rows]
+        return [row for row in rows if len(row[2]) == width]
+
+    def failures(self):
+        """Function to get the retry queue.
+
+        Returns:
+            list of (season, player, error, attempts) tuples
+        """
+        with self._lock:
+            return self._db.execute('SELECT season, player, error, attempts FROM failures ORDER BY season, player').fetchall()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    @staticmethod
+    def reset(path):
+        """Function to throw away the progress saved at path, to start a build from scratch."""
+        for file in (path, f'{path}-wal', f'{path}-shm'):
+            if os.path.exists(file):
+                os.remove(file)
@@ -0,0 +1,156 @@
+"""
+A module with the command line of the whole project, one subcommand per step:
+
+    python cli.py build-players 2000 2019           player lists per season (generate_players)
+    python cli.py build-dataset 2000 2019           labeled 30-game dataset (generate_data)
+    python cli.py train 2000-2019_mpg15_g30_playerlist --export models/allstars.keras (work)
+    python cli.py score 2020 --model models/allstars.keras                            (score)
+    python cli.py refresh-index --ttl 0             re-read the /players/{initial} pages of the player index (utils)
+
+Importing this module (or asking for --help) only imports argparse: every subcommand imports the modules it needs when
+it runs, so building a dataset never loads TensorFlow, and nothing loads bs4 or tabloo unless it's actually used.
+generate_data.py, work.py and score.py run their subcommand when run as scripts. `python benchmark.py imports` measures
+what importing each module costs.
+
+Functions:
+    build_parser():
+        will return the argument parser with every subcommand
+
+    main(argv=None):
+        will parse the arguments and run the subcommand
+
+Todo:
+    * a subcommand to record fixtures, benchmark.py --record does it for now
+"""
+import argparse
+import contextlib
+import sys
+
+
+def _configure_fetch(args):
+    """Function to apply the fetch options every subcommand that scrapes shares."""
+    import fetch
+    fetch.configure(ttl = args.ttl, workers = args.workers, offline = args.offline or None)
+
+
+def _build_players(args):
+    import generate_players
+    _configure_fetch(args)
+    name = args.name or (f'{args.start_year}_mpg{args.mpg}_g{args.g}_playerlist' if args.start_year == args.end_year else f'{args.start_year}-{args.end_year}_mpg{args.mpg}_g{args.g}_playerlist')
+    generate_players.gen_p(name, args.start_year, args.end_year, minimum_mpg = args.mpg, minimum_g = args.g, verbose = args.v)
+    print(f'saved {name}.p')
+
+
+def _build_dataset(args):
+    import generate_data
+    import instrument
+    _configure_fetch(args)
+    with instrument.profile(args.profile) if args.profile else contextlib.nullcontext():
+        print(generate_data.gen_d(args.start_year, args.end_year, args.mpg, args.g, v = args.v, workers = args.workers, resume = args.resume, processes = args.processes, num_games = args.num_games, pad = args.pad, report = args.report, all_star_source = args.all_star_source))
+
+
+def _train(args):
+    import numpy as np
+    import work #imports tensorflow
+    model, history, report = work.train(args.name, args.batch_size, args.epochs, args.seed)
+    print(f'mean examples/sec: {np.mean(report["examples_per_sec"]):.0f}')
+    if args.export:
+        import score
+        score.export_model(model, args.export, {'dataset': args.name, 'num_games': report['num_games'], 'pad': report['pad'], 'validation_accuracy': report['validation_accuracy']})
+
+
+def _score(args):
+    import score
+    _configure_fetch(args)
+    meta = score.model_metadata(args.model)
+    scores = score.score_season(score.load_model(args.model), args.season, args.mpg, args.g, args.workers, not args.no_cache, meta['num_games'], meta['pad'])
+    if args.out:
+        scores.to_csv(args.out, index=False)
+    print(scores.to_string())
+
+
+def _refresh_index(args):
+    import utils
+    _configure_fetch(args)
+    index = utils.refresh_player_index(args.letters)
+    print(f'{sum(len(entries) for entries in index["entries"].values())} players in {utils.PLAYER_INDEX_NAME}.p')
+
+
+def _add_fetch_arguments(parser):
+    parser.add_argument('--workers', type=int, default=None, help='pages fetched (and players built) at the same time')
+    parser.add_argument('--ttl', type=float, default=None, help='seconds after which cached pages are refetched')
+    parser.add_argument('--offline', action='store_true', help='only use cached pages, never the network')
+
+
+def _add_season_arguments(parser):
+    parser.add_argument('start_year', type=int, nargs='?', default=2000)
+    parser.add_argument('end_year', type=int, nargs='?', default=2019)
+    parser.add_argument('--mpg', type=int, default=15, help='minimum minutes per game')
+    parser.add_argument('--g', type=int, default=30, help='minimum games')
+    parser.add_argument('-v', action='store_true', help='verbose')
+
+
+def build_parser():
+    """Function to make the argument parser, with the subcommands build-players, build-dataset, train, score and refresh-index. Nothing but argparse is imported to build it."""
+    parser = argparse.ArgumentParser(prog='cli.py', description='Build the all-star datasets, train the classifier and score seasons.')
+    subcommands = parser.add_subparsers(dest='command', metavar='command')
+    subcommands.required = True
+
+    players = subcommands.add_parser('build-players', help='save the players meeting the minimums in every season')
+    _add_season_arguments(players)
+    players.add_argument('--name', default=None, help='file to save the player lists in, named after the seasons and minimums by default')
+    _add_fetch_arguments(players)
+    players.set_defaults(run=_build_players)
+
+    data = subcommands.add_parser('build-dataset', help='build the labeled dataset of the seasons')
+    _add_season_arguments(data)
+    data.add_argument('--processes', type=int, default=None, help='worker processes to build players in, worth it once the pages are cached')
+    data.add_argument('--num-games', type=int, default=30, help='games per row')
+    data.add_argument('--pad', type=float, default=None, help='pad players with fewer games with this value instead of dropping them')
+    data.add_argument('--resume', action='store_true', help='skip the player-seasons a previous run already finished, and retry its failures')
+    data.add_argument('--all-star-source', choices=('player_pages', 'game_page'), default=None, help="where the labels come from: every player's all-star table (the default) or one all-star game page per season")
+    data.add_argument('--report', default=None, help='json (or .csv) file to write the per-stage timings and per-season counters to')
+    data.add_argument('--profile', default=None, help='file to dump cProfile stats of the whole run to')
+    _add_fetch_arguments(data)
+    data.set_defaults(run=_build_dataset)
+
+    train = subcommands.add_parser('train', help='train the classifier on a dataset (needs tensorflow)')
+    train.add_argument('name', nargs='?', default='2014_mpg15_g30_playerlist', help='dataset name, as made by build-dataset')
+    train.add_argument('--batch-size', type=int, default=128)
+    train.add_argument('--epochs', type=int, default=5)
+    train.add_argument('--seed', type=int, default=None)
+    train.add_argument('--export', default=None, help='.keras file to save the trained model in, for score')
+    train.set_defaults(run=_train)
+
+    scoring = subcommands.add_parser('score', help="score a season's players with a trained model (needs tensorflow)")
+    scoring.add_argument('season', type=int, help='year the season ends')
+    scoring.add_argument('--model', default='models/allstars.keras', help='.keras model saved with train --export')
+    scoring.add_argument('--mpg', type=int, default=15, help='minimum minutes per game')
+    scoring.add_argument('--g', type=int, default=30, help='minimum games')
+    scoring.add_argument('--no-cache', action='store_true', help='rebuild every player instead of only the changed ones')
+    scoring.add_argument('--out', default=None, help='csv file to write the scores to')
+    _add_fetch_arguments(scoring)
+    scoring.set_defaults(run=_score)
+
+    index = subcommands.add_parser('refresh-index', help='re-read the player index pages that changed, pass --ttl 0 to download them again')
+    index.add_argument('letters', nargs='?', default='abcdefghijklmnopqrstuvwxyz', help='initials to refresh, all of them by default')
+    _add_fetch_arguments(index)
+    index.set_defaults(run=_refresh_index)
+    return parser
+
+
+def main(argv=None):
+    """Function to run the subcommand given on the command line.
+
+    Args:
+        argv (list): arguments without the program name, sys.argv[1:] if None
+
+    Returns:
+        None
+    """
+    args = build_parser().parse_args(sys.argv[1:] if argv is None else argv)
+    args.run(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,259 @@
+"""
+A module to build the flattened player-season datasets without copying them over and over, and to store them so they load instantly.
+
+On disk a dataset called name is a raw float32 matrix {name}_data.npy (features, then the target as the last column, like
+the pickles) plus a {name}_data.json sidecar with where it came from: season range, mpg, g and the feature names. Loading
+memory-maps the matrix, so nothing is read until it's used.
+
+Classes:
+    DatasetBuilder(width=690, capacity=None, chunk_rows=1024):
+        writes feature rows and labels straight into preallocated float32 arrays, and finalizes them once
+
+Functions:
+    feature_names(num_games=30):
+        will return the names of the flattened feature columns
+
+    window_tag(num_games=30, pad=None):
+        will return what goes at the end of a dataset's name when it isn't made of full 30-game windows
+
+    save_dataset(name, matrix, metadata=None):
+        will save a dataset matrix as .npy plus its metadata sidecar
+
+    load_matrix(name, mmap=True):
+        will load a dataset as one matrix with the target in the last column
+
+    load_dataset(name, mmap=True):
+        will load a dataset's features, labels and metadata, memory-mapped, converting the old pickle first if needed
+
+Todo:
+    * maybe parquet if we ever want to read it from somewhere else than python
+"""
+import json
+import os
+import re
+import time
+
+import instrument
+import numpy as np
+import pandas as pd
+
+GAME_FEATURES = ['+/-', '2P', '2P%', '2PA', '3P', '3P%', '3PA', 'AGE', 'AST', 'BLK', 'DRB', 'FT', 'FT%', 'FTA', 'GS', 'HOME', 'MOV', 'MP', 'ORB', 'PF', 'RESULT', 'STL', 'TOV']
+
+
+class DatasetBuilder:
+    """
+    Collects flattened player-season rows plus a label column into float32 arrays that are allocated up front (or grown one fixed-size chunk at a time), so adding a row never copies the rows already added. to_numpy/to_frame finalize it once; with a single chunk they don't copy at all.
+
+    Args:
+        width (int): Number of features per row, 23 categories x 30 games by default.
+        capacity (int): Rows to allocate up front. When the final row count is known (or bounded), passing it means no chunk is ever added.
+        chunk_rows (int): Rows allocated every time the builder runs out of room, when capacity isn't given.
+    """
+    def __init__(self, width=690, capacity=None, chunk_rows=1024):
+        self.width = width
+        self.chunk_rows = max(1, capacity or chunk_rows)
+        self._chunks = []
+        self._rows = 0
+
+    def __len__(self):
+        return self._rows
+
+    def _locate(self, row):
+        chunk, offset = divmod(row, self.chunk_rows)
+        return self._chunks[chunk], offset
+
+    @instrument.timed('dataset_append')
+    def append(self, features, label=np.nan):
+        """Function to add one row of features, with its label if it is already known.
+
+        Args:
+            features (array): flattened features, of length width
+            label (float): target of the row, can be filled in later with set_labels
+
+        Returns:
+            index of the new row
+        """
+        if len(features) != self.width:
+            raise ValueError(f'expected {self.width} features, got {len(features)}')
+        if self._rows == len(self._chunks)*self.chunk_rows:
+            self._chunks.append(np.empty((self.chunk_rows, self.width+1), dtype=np.float32))
+        chunk, offset = self._locate(self._rows)
+        chunk[offset, :-1] = features
+        chunk[offset, -1] = label
+        self._rows += 1
+        return self._rows - 1
+
+    @instrument.timed('dataset_append')
+    def extend(self, matrix):
+        """Function to add a block of already labeled rows, e.g. a season partition.
+
+        Args:
+            matrix (array): (rows, width+1) matrix, labels in the last column
+
+        Returns:
+            None
+        """
+        if matrix.shape[1] != self.width+1:
+            raise ValueError(f'expected {self.width+1} columns, got {matrix.shape[1]}')
+        done = 0
+        while done < len(matrix):
+            if self._rows == len(self._chunks)*self.chunk_rows:
+                self._chunks.append(np.empty((self.chunk_rows, self.width+1), dtype=np.float32))
+            chunk, offset = self._locate(self._rows)
+            n = min(len(matrix) - done, self.chunk_rows - offset)
+            chunk[offset:offset+n] = matrix[done:done+n]
+            done += n
+            self._rows += n
+
+    def set_labels(self, start, labels):
+        """Function to fill in the labels of consecutive rows, e.g. a whole season at once.
+
+        Args:
+            start (int): index of the first row to label
+            labels (array): one label per row, starting at start
+
+        Returns:
+            None
+        """
+        for row, label in enumerate(labels, start):
+            chunk, offset = self._locate(row)
+            chunk[offset, -1] = label
+
+    def _finalize(self):
+        if len(self._chunks) > 1:
+            self._chunks = [np.concatenate(self._chunks)[:self._rows]]
+            self.chunk_rows = max(1, self._rows)
+        if not self._chunks:
+            return np.empty((0, self.width+1), dtype=np.float32)
+        return self._chunks[0][:self._rows]
+
+    def to_matrix(self):
+        """Function to get the dataset as the single matrix it is stored as.
+
+        Returns:
+            (rows, width+1) float32 matrix, labels in the last column
+        """
+        return self._finalize()
+
+    def to_numpy(self):
+        """Function to get the dataset as arrays.
+
+        Returns:
+            (features, labels): a (rows, width) and a (rows,) float32 view of the same memory
+        """
+        matrix = self._finalize()
+        return matrix[:, :-1], matrix[:, -1]
+
+    def save(self, name, metadata=None):
+        """Function to save the dataset with save_dataset, see there."""
+        return save_dataset(name, self._finalize(), metadata)
+
+    def to_frame(self):
+        """Function to get the dataset as a dataframe, with columns 0..width-1 and 'target' like the pickles gen_d saves.
+
+        Returns:
+            float32 dataframe backed by the builder's memory
+        """
+        return pd.DataFrame(self._finalize(), columns=[*range(self.width), 'target'], copy=False)
+
+
+def feature_names(num_games=30):
+    """Function to get the names of the flattened feature columns, in order: every category of game 1, then game 2...
+
+    Args:
+        num_games (int): games per row
+
+    Returns:
+        list of names like 'MP_1'
+    """
+    return [f'{col}_{game}' for game in range(1, num_games+1) for col in GAME_FEATURES]
+
+
+def window_tag(num_games=30, pad=None):
+    """Function to get the tag that tells datasets with other windows apart, e.g. '_n20_pad0' for 20 games padded with 0. Full 30-game windows have none, like every dataset made before windows could change.
+
+    Args:
+        num_games (int): games per row
+        pad (float): value short windows are padded with, None if they are dropped
+
+    Returns:
+        string to append to the dataset name
+    """
+    tag = '' if num_games == 30 else f'_n{num_games}'
+    if pad is not None:
+        tag += f'_pad{pad:g}'
+    return tag
+
+
+def _metadata_from_name(name):
+    """Function to get the season range, mpg and g back out of a name like 2000-2019_mpg15_g30_playerlist."""
+    match = re.match(r'(\d{4})(?:-(\d{4}))?_mpg(\d+)_g(\d+)', os.path.basename(name))
+    if match is None:
+        return {}
+    start_year, end_year, mpg, g = match.groups()
+    return {'start_year': int(start_year), 'end_year': int(end_year or start_year), 'mpg': int(mpg), 'g': int(g)}
+
+
+def save_dataset(name, matrix, metadata=None):
+    """Function to save a dataset as {name}_data.npy, with a {name}_data.json sidecar describing it.
+
+    Args:
+        name (str): dataset name, e.g. '2014_mpg15_g30_playerlist'
+        matrix (array): (rows, features+1) matrix, target in the last column
+        metadata (dict): extra fields for the sidecar (start_year, end_year, mpg, g...), guessed from the name if missing
+
+    Returns:
+        the metadata that was written
+    """
+    matrix = np.asarray(matrix, dtype=np.float32)
+    width = matrix.shape[1] - 1
+    meta = _metadata_from_name(name)
+    meta.update(metadata or {})
+    meta.update({'rows': matrix.shape[0], 'width': width, 'dtype': 'float32', 'target_column': width,
+                 'feature_names': feature_names(width // len(GAME_FEATURES)) if width % len(GAME_FEATURES) == 0 else list(range(width)),
+                 'created': time.strftime('%Y-%m-%d %H:%M:%S')})
+    if os.path.dirname(name):
+        os.makedirs(os.path.dirname(name), exist_ok=True)
+    tmp = f'{name}_data.tmp.npy'
+    np.save(tmp, matrix)
+    os.replace(tmp, f'{name}_data.npy')
+    with open(f'{name}_data.json', 'w') as fp:
+        json.dump(meta, fp, indent=1)
+    return meta
+
+
+def load_matrix(name, mmap=True):
+    """Function to load a dataset as the single matrix it is stored as, target in the last column. If there is only the old {name}_data pickle, it is converted once first.
+
+    Args:
+        name (str): dataset name, e.g. '2014_mpg15_g30_playerlist'
+        mmap (bool): when True the matrix is memory-mapped read-only instead of read into memory
+
+    Returns:
+        (rows, width+1) float32 matrix
+
+    Raises:
+        FileNotFoundError: if the dataset was never built
+    """
+    if not os.path.exists(f'{name}_data.npy'):
+        save_dataset(name, pd.read_pickle(f'{name}_data').to_numpy(dtype=np.float32))
+    return np.load(f'{name}_data.npy', mmap_mode='r' if mmap else None)
+
+
+def load_dataset(name, mmap=True):
+    """Function to load a dataset saved with save_dataset. If there is only the old {name}_data pickle, it is converted once first.
+
+    Args:
+        name (str): dataset name, e.g. '2014_mpg15_g30_playerlist'
+        mmap (bool): when True the matrix is memory-mapped read-only instead of read into memory
+
+    Returns:
+        (features, labels, metadata): (rows, width) and (rows,) float32 views of the same matrix, and the sidecar dictionary
+    """
+    matrix = load_matrix(name, mmap)
+    try:
+        with open(f'{name}_data.json') as fp:
+            meta = json.load(fp)
+    except FileNotFoundError:
+        meta = _metadata_from_name(name)
+    return matrix[:, :-1], matrix[:, -1], meta
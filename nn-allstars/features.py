@@ -0,0 +1,41 @@
+"""
+A module that turns a player's featurized games (one row per game, see generate_data.featurize_game_log) into model
+inputs of any size, instead of exactly the first 30 games.
+
+A window is a slice of the games plus padding, done on the whole array at once. Short windows are either rejected or
+padded with a value, datasets built with a pad are tagged with it (see dataset.window_tag).
+
+Functions:
+    window(games, num_games=30, pad=None):
+        will return the flattened first num_games games, padded if there are fewer
+
+Todo:
+    * a mask of the padded games saved with the dataset, with pad=0 padding looks just like games the player sat out
+"""
+import numpy as np
+
+from dataset import GAME_FEATURES
+
+
+def _values(games):
+    return np.asarray(games, dtype=np.float64).reshape(-1, len(GAME_FEATURES))
+
+
+def window(games, num_games=30, pad=None):
+    """
+    Will flatten the first num_games games into one row, game-major like the datasets (every category of game 1, then game 2...).
+
+    Args:
+        games (DataFrame or array): featurized games, one row per game in order
+        num_games (int): games per window
+        pad (float): value filling the games a short window doesn't have. None means short windows aren't padded but rejected.
+
+    Returns:
+        (num_games*len(GAME_FEATURES),) float32 row, or None if there are fewer than num_games games and pad is None
+    """
+    values = _values(games)[:num_games]
+    if len(values) < num_games:
+        if pad is None:
+            return None
+        values = np.vstack([values, np.full((num_games - len(values), values.shape[1]), pad)])
+    return values.astype(np.float32).reshape(-1)
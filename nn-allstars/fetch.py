@@ -0,0 +1,449 @@
+"""
+A module that every request to basketball-reference goes through, so the same page is never downloaded twice.
+
+Responses are stored on disk (one pickle per url) in CACHE_DIR. Entries older than TTL seconds are refetched, and once the
+cache grows past MAX_BYTES the least recently used entries are evicted. In offline mode the network is never touched:
+cached pages are served even if stale, and anything that isn't cached raises OfflineError.
+
+Network requests share one keep-alive session, are spaced out to at most RATE requests per second per host, and are
+retried with exponential backoff on 429 and 5xx responses. fetch_all and map_ordered run work on a pool of WORKERS
+threads and always hand results back in the order the inputs were given.
+
+Fixtures are a second store of responses, in the same format, that is never evicted and never goes stale, so benchmarks
+can be replayed on exactly the same pages. In 'record' mode every page (or 404) get returns is also saved as a fixture, in
+'replay' mode responses only come from the fixtures and anything else raises OfflineError. NBA_FIXTURES and
+NBA_FIXTURE_MODE set them from the environment.
+
+Functions:
+    get(url):
+        will return the response for a url, from the cache if possible
+
+    fetch_all(urls, workers=None):
+        will get many pages concurrently, returning the responses in the same order as the urls
+
+    map_ordered(fn, items, workers=None):
+        will call fn on every item on the thread pool, returning the results in the same order as the items
+
+    configure(cache_dir=None, ttl=None, max_bytes=None, offline=None, rate=None, workers=None, retries=None, fixtures=None, fixture_mode=None):
+        will change where and for how long responses are cached, whether the network may be used, how hard we hit it and whether fixtures are recorded or replayed
+
+    settings():
+        will return the current settings, in the form configure takes them
+
+    check_status(response):
+        will raise StatusError if a response is a 429, 5xx... rather than a page or a 404
+
+    stats():
+        will return the hit/miss counters of the cache
+
+    clear_cache():
+        will delete every cached response
+
+Todo:
+    * maybe cache the parsed tables too, not just the raw pages
+"""
+import hashlib
+import os
+import pickle
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+import instrument
+import requests
+
+from requests.adapters import HTTPAdapter
+
+CACHE_DIR = '.http_cache'
+TTL = 7*24*60*60 #a week, game logs of a finished season never change but the current one does
+MAX_BYTES = 2*1024**3
+OFFLINE = os.environ.get('NBA_OFFLINE', '') not in ('', '0')
+CACHEABLE_STATUS = (200, 404) #anything else (429, 5xx...) is worth retrying later
+RETRY_STATUS = (429, 500, 502, 503, 504)
+RATE = 20/60 #sports-reference asks for no more than 20 requests a minute
+WORKERS = 8
+RETRIES = 5
+BACKOFF = 2.0 #seconds, doubled after every failed attempt
+FIXTURE_DIR = os.environ.get('NBA_FIXTURES', 'fixtures')
+FIXTURE_MODE = os.environ.get('NBA_FIXTURE_MODE') or None #None, 'record' or 'replay'
+FIXTURE_MODES = (None, 'record', 'replay')
+
+
+class OfflineError(LookupError):
+    """Raised when a url is requested in offline mode and isn't in the cache."""
+
+
+class StatusError(IOError):
+    """Raised by check_status when a page came back with a status worth retrying later (429, 5xx...) instead of the page."""
+
+
+RETRYABLE_ERRORS = (OfflineError, StatusError, requests.RequestException) #failures that say nothing about the page itself, a later run may well get it
+
+
+class Response:
+    """The bits of a requests.Response that the rest of the code uses, small enough to pickle."""
+    def __init__(self, url, status_code, content, fetched_at=None):
+        self.url = url
+        self.status_code = status_code
+        self.content = content
+        self.fetched_at = time.time() if fetched_at is None else fetched_at
+
+    @property
+    def text(self):
+        return self.content.decode('utf-8', errors='replace')
+
+
+class ResponseCache:
+    """
+    On-disk response store keyed by url, with a time to live and a size bound enforced by least recently used eviction.
+
+    Args:
+        directory (str): Folder where responses are stored, created if needed.
+        ttl (float or None): Seconds after which an entry is stale. None means entries never go stale.
+        max_bytes (int): Size the cache is allowed to grow to before evicting.
+    """
+    def __init__(self, directory, ttl=TTL, max_bytes=MAX_BYTES):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.counters = {'hits': 0, 'misses': 0, 'stale': 0, 'evictions': 0}
+        self._lock = threading.Lock()
+        self._index = None #key -> [size, last_used], built lazily from the directory
+
+    def _path(self, key):
+        return os.path.join(self.directory, f'{key}.p')
+
+    @staticmethod
+    def key(url):
+        return hashlib.sha1(url.encode('utf-8')).hexdigest()
+
+    def _load_index(self):
+        if self._index is not None:
+            return
+        self._index = {}
+        os.makedirs(self.directory, exist_ok=True)
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.p'):
+                st = entry.stat()
+                self._index[entry.name[:-2]] = [st.st_size, st.st_mtime]
+
+    def size(self):
+        with self._lock:
+            self._load_index()
+            return sum(size for size, _ in self._index.values())
+
+    def lookup(self, url, allow_stale=False):
+        """Return the cached Response for url, or None if it isn't cached (or is stale and allow_stale is False)."""
+        key = self.key(url)
+        with self._lock:
+            self._load_index()
+            if key not in self._index:
+                self.counters['misses'] += 1
+                return None
+        try:
+            with open(self._path(key), 'rb') as fp:
+                response = pickle.load(fp)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            with self._lock:
+                self._index.pop(key, None)
+                self.counters['misses'] += 1
+            return None
+        if self.ttl is not None and time.time() - response.fetched_at > self.ttl and not allow_stale:
+            with self._lock:
+                self.counters['stale'] += 1
+            return None
+        now = time.time()
+        with self._lock:
+            self.counters['hits'] += 1
+            if key in self._index:
+                self._index[key][1] = now
+        try:
+            os.utime(self._path(key), (now, now)) #mtime doubles as last use so the lru order survives restarts
+        except OSError:
+            pass
+        return response
+
+    def store(self, response):
+        """Write a Response to disk, then evict old entries if the cache is over its size bound."""
+        key = self.key(response.url)
+        path = self._path(key)
+        with self._lock:
+            self._load_index()
+        tmp = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp, 'wb') as fp:
+            pickle.dump(response, fp, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path) #atomic, so a crash never leaves half a page behind
+        with self._lock:
+            self._index[key] = [os.path.getsize(path), time.time()]
+            self._evict()
+
+    def _evict(self):
+        total = sum(size for size, _ in self._index.values())
+        if total <= self.max_bytes:
+            return
+        #evict down to 90% so we don't end up sorting on every single store
+        for key, (size, _) in sorted(self._index.items(), key=lambda kv: kv[1][1]):
+            if total <= 0.9*self.max_bytes:
+                break
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+            del self._index[key]
+            total -= size
+            self.counters['evictions'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._load_index()
+            for key in list(self._index):
+                try:
+                    os.remove(self._path(key))
+                except OSError:
+                    pass
+            self._index = {}
+
+
+class RateLimiter:
+    """
+    Spaces out requests so that no host gets more than `rate` requests per second, whichever thread they come from.
+
+    Args:
+        rate (float): Requests per second allowed per host.
+    """
+    def __init__(self, rate=RATE):
+        self.rate = rate
+        self._lock = threading.Lock()
+        self._next = {} #host -> earliest time the next request may go out
+
+    def wait(self, host):
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next.get(host, now))
+            self._next[host] = slot + 1/self.rate
+        if slot > now:
+            time.sleep(slot - now)
+
+
+_cache = ResponseCache(CACHE_DIR)
+_fixtures = ResponseCache(FIXTURE_DIR, ttl=None, max_bytes=float('inf'))
+_limiter = RateLimiter(RATE)
+_session = requests.Session()
+_session.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=WORKERS))
+_session.mount('http://', HTTPAdapter(pool_connections=4, pool_maxsize=WORKERS))
+_inflight = {} #url -> lock, so two threads asking for the same page only download it once
+_inflight_lock = threading.Lock()
+
+
+def configure(cache_dir=None, ttl=None, max_bytes=None, offline=None, rate=None, workers=None, retries=None, fixtures=None, fixture_mode=None):
+    """Function to change the cache and network settings. Arguments left as None keep their current value.
+
+    Args:
+        cache_dir (str): Folder where responses are stored.
+        ttl (float): Seconds after which a cached response is refetched. Pass float('inf') to never refetch.
+        max_bytes (int): Size bound of the cache.
+        offline (bool): When True, never touch the network.
+        rate (float): Requests per second allowed per host.
+        workers (int): Default number of threads used by fetch_all and map_ordered.
+        retries (int): How many times a 429/5xx or connection error is retried before giving up.
+        fixtures (str): Folder where fixtures are recorded to or replayed from.
+        fixture_mode (str): 'record', 'replay', or 'off' to stop using fixtures.
+
+    Returns:
+        None
+    """
+    global _cache, _fixtures, OFFLINE, WORKERS, RETRIES, FIXTURE_MODE
+    if cache_dir is not None and cache_dir != _cache.directory:
+        _cache = ResponseCache(cache_dir, _cache.ttl, _cache.max_bytes)
+    if ttl is not None:
+        _cache.ttl = None if ttl == float('inf') else ttl
+    if max_bytes is not None:
+        _cache.max_bytes = max_bytes
+    if offline is not None:
+        OFFLINE = offline
+    if rate is not None:
+        _limiter.rate = rate
+    if workers is not None:
+        WORKERS = workers
+        for prefix in ('https://', 'http://'):
+            _session.mount(prefix, HTTPAdapter(pool_connections=4, pool_maxsize=workers))
+    if retries is not None:
+        RETRIES = retries
+    if fixtures is not None and fixtures != _fixtures.directory:
+        _fixtures = ResponseCache(fixtures, ttl=None, max_bytes=float('inf'))
+    if fixture_mode is not None:
+        fixture_mode = None if fixture_mode == 'off' else fixture_mode
+        if fixture_mode not in FIXTURE_MODES:
+            raise ValueError(f'fixture_mode must be one of record, replay or off, not {fixture_mode!r}')
+        FIXTURE_MODE = fixture_mode
+
+
+def _download(url):
+    """Function to download a page over the shared session, respecting the rate limit and retrying with backoff."""
+    host = urlparse(url).netloc
+    delay = BACKOFF
+    for attempt in range(RETRIES+1):
+        _limiter.wait(host)
+        try:
+            r = _session.get(url, timeout=30)
+        except (requests.ConnectionError, requests.Timeout):
+            if attempt == RETRIES:
+                raise
+            instrument.count('retries')
+        else:
+            if r.status_code not in RETRY_STATUS or attempt == RETRIES:
+                return r
+            instrument.count('retries')
+            try:
+                delay = max(delay, float(r.headers.get('Retry-After', 0)))
+            except ValueError:
+                pass
+        time.sleep(delay)
+        delay *= 2
+
+
+def get(url):
+    """Function to get a page, going through the on-disk cache.
+
+    Args:
+        url (str): The url to fetch.
+
+    Returns:
+        Response with the url, status_code and content of the page.
+
+    Raises:
+        OfflineError: if in offline mode and the url has never been fetched, or in replay mode and the url isn't a fixture.
+    """
+    if FIXTURE_MODE == 'replay':
+        response = _fixtures.lookup(url, allow_stale=True)
+        if response is None:
+            instrument.count('failures')
+            raise OfflineError(f'{url} is not in the fixtures at {_fixtures.directory}')
+        instrument.count('cache_hits')
+        return response
+    response = _get(url)
+    if FIXTURE_MODE == 'record' and response.status_code in CACHEABLE_STATUS:
+        #a 429 or 5xx left after the retries would fail every replay
+        _fixtures.store(response)
+    return response
+
+
+def _get(url):
+    """Function doing the work of get outside of replay mode: the cache, then the network."""
+    response = _cache.lookup(url, allow_stale=OFFLINE)
+    if response is not None:
+        instrument.count('cache_hits')
+        return response
+    if OFFLINE:
+        instrument.count('failures')
+        raise OfflineError(f'{url} is not cached and offline mode is on')
+    with _inflight_lock:
+        url_lock = _inflight.setdefault(url, threading.Lock())
+    contended = not url_lock.acquire(blocking=False)
+    if contended:
+        url_lock.acquire()
+    try:
+        #another thread may have downloaded it while we waited on the lock
+        response = _cache.lookup(url) if contended else None
+        if response is not None:
+            instrument.count('cache_hits')
+            return response
+        try:
+            with instrument.stage('download'):
+                r = _download(url)
+        except requests.RequestException:
+            instrument.count('failures')
+            raise
+        response = Response(url, r.status_code, r.content)
+        instrument.count('requests')
+        instrument.count('bytes', len(response.content))
+        if response.status_code in CACHEABLE_STATUS:
+            _cache.store(response)
+        else:
+            instrument.count('failures')
+        return response
+    finally:
+        url_lock.release()
+        with _inflight_lock:
+            _inflight.pop(url, None)
+
+
+def check_status(response):
+    """Function to make sure a response is the page (or a 404 saying there is no such page), not a ban or a server error.
+
+    Args:
+        response (Response): what get returned
+
+    Returns:
+        the response
+
+    Raises:
+        StatusError: if the status is anything but CACHEABLE_STATUS, the page should be asked for again later
+    """
+    if response.status_code not in CACHEABLE_STATUS:
+        raise StatusError(f'{response.url} came back with status {response.status_code}')
+    return response
+
+
+def map_ordered(fn, items, workers=None):
+    """Function to call fn on every item using a pool of threads.
+
+    Args:
+        fn (callable): Function taking one item.
+        items (iterable): Inputs to fn.
+        workers (int): Number of threads, WORKERS by default. 1 runs everything in the calling thread.
+
+    Returns:
+        list with fn(item) for every item, in the same order as items
+    """
+    workers = WORKERS if workers is None else workers
+    if workers <= 1:
+        return [fn(item) for item in items]
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(fn, items))
+
+
+def fetch_all(urls, workers=None):
+    """Function to get many pages concurrently, going through the cache.
+
+    Args:
+        urls (list): The urls to fetch.
+        workers (int): Number of threads, WORKERS by default.
+
+    Returns:
+        list of Responses, in the same order as urls
+    """
+    return map_ordered(get, urls, workers)
+
+
+def settings():
+    """Function to get the current cache and network settings, e.g. to set up a worker process the same way with configure(**settings()).
+
+    Returns:
+        Dictionary with the keyword arguments of configure.
+    """
+    return {'cache_dir': _cache.directory, 'ttl': float('inf') if _cache.ttl is None else _cache.ttl, 'max_bytes': _cache.max_bytes,
+            'offline': OFFLINE, 'rate': _limiter.rate, 'workers': WORKERS, 'retries': RETRIES,
+            'fixtures': _fixtures.directory, 'fixture_mode': FIXTURE_MODE or 'off'}
+
+
+def stats():
+    """Function to get the hit/miss counters of the cache.
+
+    Returns:
+        Dictionary with the number of hits, misses, stale entries and evictions, plus the current size in bytes.
+    """
+    counters = dict(_cache.counters)
+    counters['bytes'] = _cache.size()
+    return counters
+
+
+def clear_cache():
+    """Function to delete every cached response.
+
+    Returns:
+        None
+    """
+    _cache.clear()
@@ -0,0 +1,287 @@
+"""
+A module that keeps players' parsed gamelog pages in memory, so every (player, year) page is fetched and parsed exactly once no matter how many date windows are cut out of it.
+
+A window only reads the pages of the seasons it can overlap (see page_years, a pre-all-star window is on a single page), and
+a page several windows read is fetched and parsed once. Pages are cleaned once when they are parsed (header rows dropped,
+home/away mapped, inactive games zero-filled) and windows are cut out of them with a date filter.
+
+Pages are kept compact: counting stats are the smallest int that holds them (int8 for almost everything), percentages,
+minutes and age are float32, team/opponent/home/result are categoricals, dates are datetime64 and the margin of victory
+gets its own int8 column instead of living in the result string. A 30-game page takes about 2 KiB instead of the 35+ KiB of
+the object columns it is parsed into (`python benchmark.py memory`), the team categories being shared by every page.
+
+Classes:
+    GameLogStore(max_pages=4096):
+        parsed gamelog pages keyed by (player suffix, year, playoffs), with a bound on how many are kept
+
+Functions:
+    normalize_game_log(df):
+        will clean a raw gamelog table the way every window of it needs, into compact columns
+
+    page_url(suffix, year, playoffs=False):
+        will return the url of a player's gamelog page for a year
+
+    season_span(year):
+        will return the first and last day a season's page can have a game on
+
+    page_years(start_date, end_date):
+        will return the years of the season pages a date window can overlap
+
+Todo:
+    * maybe keep the store on disk too, next to the http cache
+"""
+import threading
+
+from collections import OrderedDict
+
+import instrument
+import numpy as np
+import pandas as pd
+import fetch
+import tables
+
+from basketball_reference_scraper.constants import TEAM_TO_TEAM_ABBR
+from fetch import get
+
+GAME_INFO_COLUMNS = ['Rk', 'G', 'DATE', 'AGE', 'TEAM', 'HOME/AWAY', 'OPPONENT', 'RESULT'] #the columns that survive when a player didn't play
+RENAMES = {'Date': 'DATE', 'Age': 'AGE', 'Tm': 'TEAM', 'Unnamed: 5': 'HOME/AWAY', 'Opp': 'OPPONENT','Unnamed: 7': 'RESULT', 'GmSc': 'GAME_SCORE'}
+COUNT_COLUMNS = ['Rk', 'G', 'GS', 'FG', 'FGA', '3P', '3PA', 'FT', 'FTA', 'ORB', 'DRB', 'TRB', 'AST', 'STL', 'BLK', 'TOV', 'PF', 'PTS', '+/-']
+RATE_COLUMNS = ['FG%', '3P%', 'FT%', 'GAME_SCORE']
+#fixed categories, so pages of different seasons concatenate without falling back to object columns
+TEAMS = pd.CategoricalDtype(sorted(set(TEAM_TO_TEAM_ABBR.values())))
+HOME_AWAY = pd.CategoricalDtype(['AWAY', 'HOME'])
+RESULTS = pd.CategoricalDtype(['L', 'W'])
+
+
+def _count(values):
+    """Function to store a column of whole numbers in the smallest int that holds them, or float32 if some are missing (e.g. +/- before it was tracked)."""
+    values = np.asarray(pd.to_numeric(values), dtype=float)
+    if np.isnan(values).any():
+        return values.astype(np.float32)
+    for dtype in (np.int8, np.int16, np.int32):
+        info = np.iinfo(dtype)
+        if not len(values) or (values.min() >= info.min and values.max() <= info.max):
+            return values.astype(dtype)
+    return values.astype(np.int64)
+
+
+def _split_to_fraction(values, sep, denominator):
+    """Function to turn a column of 'a{sep}b' strings into a + b/denominator, rounded to 3 decimals, as float32. Anything without a separator (inactive games) counts as 0."""
+    parts = pd.Series(values, dtype=object).astype(str).str.split(sep, n=1, expand=True)
+    if not len(parts):
+        return np.empty(0, dtype=np.float32)
+    whole = pd.to_numeric(parts[0]).to_numpy(dtype=float)
+    if parts.shape[1] > 1:
+        frac = pd.to_numeric(parts[1], errors='coerce').fillna(0).to_numpy(dtype=float)
+    else:
+        frac = np.zeros(len(parts))
+    return np.round(whole + frac/denominator, 3).astype(np.float32)
+
+
+_RESULT = r'^(\w)\w* \(([-+]?\d+)\)'
+
+def _results(values):
+    """Function to split results like 'W (+5)' into the 'W'/'L' categorical and the margin of victory, NaN when a result doesn't look like that."""
+    result = pd.Series(values, dtype=object).astype(str).str.extract(_RESULT)
+    outcome = pd.Categorical(result[0], dtype=RESULTS)
+    return outcome, _count(pd.to_numeric(result[1]))
+
+
+def _frame_bytes(frames):
+    """Function to get the bytes a list of dataframes take, counting the categories shared by their categorical columns (e.g. TEAMS) once instead of once per column like memory_usage(deep=True) does."""
+    total, seen = 0, set()
+    for df in frames:
+        total += int(df.index.memory_usage(deep=True))
+        for col in df.columns:
+            values = df[col]
+            if isinstance(values.dtype, pd.CategoricalDtype):
+                total += values.cat.codes.nbytes
+                if id(values.cat.categories) not in seen:
+                    seen.add(id(values.cat.categories))
+                    total += int(values.cat.categories.memory_usage(deep=True))
+            else:
+                total += int(values.memory_usage(deep=True, index=False))
+    return total
+
+
+def _teams(values):
+    """Function to store team abbreviations as a TEAMS categorical, or as categories of their own if the page has a team TEAMS doesn't know."""
+    teams = pd.Categorical(values, dtype=TEAMS)
+    if ((teams.codes == -1) & ~pd.isna(values)).any():
+        return pd.Categorical(values)
+    return teams
+
+
+def normalize_game_log(df):
+    """
+    Will clean one raw gamelog table (as parsed from the page) into compact columns. Games the player was inactive for keep their game info but get all their stats set to 0.
+
+    Args:
+        df (DataFrame): Raw gamelog table
+
+    Returns:
+        cleaned dataframe, see generate_data.get_game_logs for the columns. COUNT_COLUMNS are ints (float32 if some are missing), RATE_COLUMNS float32, MP in minutes and AGE in years as float32, DATE datetime64, TEAM/OPPONENT/HOME/AWAY/RESULT categoricals ('W' or 'L') and MOV the margin of victory as int8
+    """
+    keep = (df['Rk']!='Rk').to_numpy()
+    #'Inactive', 'Did Not Play'... fill every stat column instead of GS being 0 or 1
+    inactive = pd.to_numeric(df['GS'], errors='coerce').isna().to_numpy()[keep]
+    #every column is converted as an array and the frame made once at the end, setting columns one by one costs more than the conversions
+    columns = {}
+    for col, values in df.items():
+        col = RENAMES.get(col, col)
+        if col == 'Unnamed: 30':
+            continue
+        values = values.to_numpy()[keep]
+        if col not in GAME_INFO_COLUMNS and inactive.any():
+            values = np.where(inactive, 0, values)
+        if col in COUNT_COLUMNS:
+            values = _count(values)
+        elif col in RATE_COLUMNS:
+            values = np.asarray(pd.to_numeric(values), dtype=np.float32)
+        elif col == 'MP':
+            values = _split_to_fraction(values, ':', 60)
+        elif col == 'AGE':
+            values = _split_to_fraction(values, '-', 365)
+        elif col == 'DATE':
+            values = pd.to_datetime(values, format='%Y-%m-%d').to_numpy()
+        elif col in ('TEAM', 'OPPONENT'):
+            values = _teams(values)
+        elif col == 'HOME/AWAY':
+            values = pd.Categorical(np.where(values=='@', 'AWAY', 'HOME'), dtype=HOME_AWAY)
+        elif col == 'RESULT':
+            values, columns['MOV'] = _results(values)
+            columns['RESULT'] = values
+            continue
+        columns[col] = values
+    order = [col for col in columns if col != 'MOV']
+    order.insert(order.index('RESULT')+1, 'MOV')
+    return pd.DataFrame({col: columns[col] for col in order})
+
+
+def page_url(suffix, year, playoffs=False):
+    """Function to get the url of the widget with a player's gamelog for a year.
+
+    Args:
+        suffix (str): bbref suffix of the player, e.g. '/players/j/jamesle01.html'
+        year (int): year of the gamelog page (the year the season ended)
+        playoffs (bool): whether to get the playoff gamelog
+
+    Returns:
+        url string
+    """
+    if playoffs:
+        selector = 'div_pgl_basic_playoffs'
+    else:
+        selector = 'div_pgl_basic'
+    encoded = suffix.replace('/', '%2F').replace('.html', '')
+    return f'https://widgets.sports-reference.com/wg.fcgi?css=1&site=bbr&url={encoded}%2Fgamelog%2F{year}&div={selector}'
+
+
+#seasons whose games ran past July, the last day their pages can have a game on
+LATE_SEASON_ENDS = {2020: '2020-10-31'}
+
+
+def season_span(year):
+    """Function to get the first and last day a season's gamelog page can have a game on, from September before it starts to the end of July after it ends (later for LATE_SEASON_ENDS)."""
+    return pd.Timestamp(f'{year-1}-09-01'), pd.Timestamp(LATE_SEASON_ENDS.get(year, f'{year}-07-31'))
+
+
+def page_years(start_date, end_date):
+    """Function to get the years of the pages a date window is cut out of: the seasons whose span overlaps it, e.g. only 2014 for 2013-08-01 to 2014-02-20."""
+    start, end = pd.to_datetime(start_date), pd.to_datetime(end_date)
+    years = []
+    for year in range(start.year, end.year+2):
+        first, last = season_span(year)
+        if first <= end and last >= start:
+            years.append(year)
+    return years
+
+
+class GameLogStore:
+    """
+    Parsed, cleaned gamelog pages keyed by (player suffix, year, playoffs). A page is downloaded and parsed the first time any window needs it, and served from memory after that. When more than max_pages are held the least recently used ones are dropped; evict() drops a player's pages once they're done with.
+
+    Args:
+        max_pages (int): How many pages to keep in memory at most.
+    """
+    def __init__(self, max_pages=4096):
+        self.max_pages = max_pages
+        self._pages = OrderedDict()
+        self._lock = threading.Lock()
+
+    def page(self, suffix, year, playoffs=False):
+        """Function to get one cleaned gamelog page.
+
+        Args:
+            suffix (str): bbref suffix of the player, e.g. '/players/j/jamesle01.html'
+            year (int): year of the gamelog page (the year the season ended)
+            playoffs (bool): whether to get the playoff gamelog
+
+        Returns:
+            dataframe of every game on the page, or None if the page has no table
+        """
+        key = (suffix, year, playoffs)
+        with self._lock:
+            if key in self._pages:
+                self._pages.move_to_end(key)
+                return self._pages[key]
+        df = self._load(suffix, year, playoffs)
+        with self._lock:
+            self._pages[key] = df
+            while len(self._pages) > self.max_pages:
+                self._pages.popitem(last=False)
+        return df
+
+    @staticmethod
+    def _load(suffix, year, playoffs):
+        r = fetch.check_status(get(page_url(suffix, year, playoffs))) #a 429 isn't a player without games, it has to fail the window
+        if r.status_code!=200:
+            return None
+        with instrument.stage('parse'):
+            df = tables.read_table(r.content)
+            if df is None or df.empty:
+                return None
+            return normalize_game_log(df)
+
+    def games(self, suffix, start_date, end_date, playoffs=False):
+        """Function to get a player's games between two dates, out of the pages of every year the dates could fall in.
+
+        Args:
+            suffix (str): bbref suffix of the player
+            start_date (str): Inclusive start date of game logs in format 'YYYY-MM-DD'
+            end_date (str): Inclusive end date of game logs in format 'YYYY-MM-DD'
+            playoffs (bool): whether to get playoff games
+
+        Returns:
+            dataframe of the games, or None if none of the pages had a table
+        """
+        frames = []
+        for year in page_years(start_date, end_date):
+            df = self.page(suffix, year, playoffs)
+            if df is not None:
+                frames.append(df.loc[(df['DATE'] >= start_date) & (df['DATE'] <= end_date)])
+        if not frames:
+            return None
+        df = pd.concat(frames)
+        for col in ('TEAM', 'OPPONENT'): #only when a page had a team TEAMS doesn't know
+            if df[col].dtype != 'category':
+                df[col] = df[col].astype('category')
+        return df
+
+    def memory_usage(self):
+        """Function to get how many bytes the pages held right now take."""
+        with self._lock:
+            pages = list(self._pages.values())
+        return _frame_bytes([df for df in pages if df is not None])
+
+    def evict(self, suffix):
+        """Function to drop every page of a player, once all their windows are built."""
+        with self._lock:
+            for key in [key for key in self._pages if key[0] == suffix]:
+                del self._pages[key]
+
+    def __len__(self):
+        return len(self._pages)
+
+
+store = GameLogStore()
@@ -1,116 +1,116 @@
+import json
+import os
+import sys
 import pandas as pd
 import numpy as np
+import checkpoint
+import dataset
+import features
+import fetch
+import gamelogs
 import generate_players
+import instrument
 import utils
-import tabloo #useful for debugging: tabloo.show(df)
 
-from requests import get
-from basketball_reference_scraper.players import get_stats
+from concurrent.futures import ProcessPoolExecutor
 
-from bs4 import BeautifulSoup
+FEATURE_COLUMNS = dataset.GAME_FEATURES
+SHARD_PLAYERS = 16 #players per task in process mode, small enough that progress is checkpointed often
+def clean_game_log(df, start_date, end_date):
+    """
+    Will clean one raw gamelog table (as parsed from the page) and keep only the games between the dates. Games the player was inactive for keep their game info but get all their stats set to 0.
+
+    Args:
+        df (DataFrame): Raw gamelog table
+        start_date (str): Inclusive start date of game logs in format 'YYYY-MM-DD'
+        end_date (str): Inclusive end date of game logs in format 'YYYY-MM-DD'
 
-def get_game_logs(name, start_date, end_date, playoffs=False, num_games = None):
+    Returns:
+        cleaned dataframe, see get_game_logs for the columns
+    """
+    df = gamelogs.normalize_game_log(df)
+    return df.loc[(df['DATE'] >= start_date) & (df['DATE'] <= end_date)]
+
+@instrument.timed('game_logs')
+def get_game_logs(name, start_date, end_date, playoffs=False, num_games = None, season = None):
     """
-    Will get the raw gamelogs for a given player in the given date ranges
+    Will get the raw gamelogs for a given player in the given date ranges. Pages come from gamelogs.store, so each (player, year) page is only fetched and parsed once however many windows use it.
 
     Args:
         name (str): Name of player whose games you want
         start_date (str): Inclusive start date of game logs in format 'YYYY-MM-DD'
         end_date (str): Inclusive end date of game logs in format 'YYYY-MM-DD'
         playoffs (bool): Whetehr or not to include playoff games
+        season (int): Season the games are from, used to tell apart players with the same name
 
     Returns:
-        returns a dataframe with a record of games between the dates, including categories ['Rk', 'G', 'DATE', 'AGE', 'TEAM', 'HOME/AWAY', 'OPPONENT', 'RESULT', 'GS', 'MP', 'FG', 'FGA', 'FG%', '3P', '3PA', '3P%', 'FT', 'FTA', 'FT%', 'ORB', 'DRB', 'TRB', 'AST', 'STL', 'BLK', 'TOV', 'PF', 'PTS', 'GAME_SCORE', '+/-']
+        returns a dataframe with a record of games between the dates, including categories ['Rk', 'G', 'DATE', 'AGE', 'TEAM', 'HOME/AWAY', 'OPPONENT', 'RESULT', 'MOV', 'GS', 'MP', 'FG', 'FGA', 'FG%', '3P', '3PA', '3P%', 'FT', 'FTA', 'FT%', 'ORB', 'DRB', 'TRB', 'AST', 'STL', 'BLK', 'TOV', 'PF', 'PTS', 'GAME_SCORE', '+/-'], in the compact types of gamelogs.normalize_game_log
    """
-    suffix = utils.get_player_suffix(name).replace('/', '%2F').replace('.html', '')
-    start_date_str = start_date
-    end_date_str = end_date
-    start_date = pd.to_datetime(start_date)
-    end_date = pd.to_datetime(end_date)
-    years = list(range(start_date.year, end_date.year+2))
-    if playoffs:
-        selector = 'div_pgl_basic_playoffs'
-    else:
-        selector = 'div_pgl_basic'
-    final_df = None
-    for year in years:
-        url = f'https://widgets.sports-reference.com/wg.fcgi?css=1&site=bbr&url={suffix}%2Fgamelog%2F{year}&div={selector}'
-        r = get(url)
-        if r.status_code==200:
-            soup = BeautifulSoup(r.content, 'html.parser')
-            table = soup.find('table')
-            try:
-                df = pd.read_html(str(table))[0]
-            except ValueError as e:
-                continue
-            df.rename(columns = {'Date': 'DATE', 'Age': 'AGE', 'Tm': 'TEAM', 'Unnamed: 5': 'HOME/AWAY', 'Opp': 'OPPONENT','Unnamed: 7': 'RESULT', 'GmSc': 'GAME_SCORE'}, inplace=True)
-            df['HOME/AWAY'] = df['HOME/AWAY'].apply(lambda x: 'AWAY' if x=='@' else 'HOME')
-            df = df[df['Rk']!='Rk']
-            try:
-                df = df.drop(['Unnamed: 30'], axis=1)
-            except Exception as e:
-                pass
-            df = df.loc[(df['DATE'] >= start_date_str) & (df['DATE'] <= end_date_str)]
-            active_df = pd.DataFrame(columns = list(df.columns))
-            for index, row in df.iterrows():
-                if len(row['GS'])>1:
-                    empty_game = pd.DataFrame([[row['Rk'], row['G'], row['DATE'], row['AGE'], row['TEAM'], row['HOME/AWAY'], row['OPPONENT'], row['RESULT'], 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0]])
-                    empty_game.columns = list(df.columns)
-                    active_df = active_df.append(empty_game)
-                    continue
-                active_df = active_df.append(row)
-            if final_df is None:
-                final_df = pd.DataFrame(columns=list(active_df.columns))
-            final_df = final_df.append(active_df)
+    final_df = gamelogs.store.games(utils.get_player_suffix(name, season), start_date, end_date, playoffs)
     if num_games != None:
-        final_df = final_df[(final_df['Rk'].astype(int) <= num_games)]
+        final_df = final_df[final_df['Rk'] <= num_games]
     return final_df
 
-def get_pre_allstar_data(name, season):
+def featurize_game_log(df):
+    """
+    Will turn cleaned gamelogs into the numeric per-game features used for training: shooting splits with 2P derived from FG and 3P, minutes and age as fractions, home/result as 0/1 and the margin of victory. The compact columns of gamelogs.normalize_game_log already hold most of them as numbers, everything is done on whole columns.
+
+    Args:
+        df (DataFrame): gamelogs as returned by get_game_logs
+
+    Returns:
+        dataframe of float32 columns FEATURE_COLUMNS, one row per game
+    """
+    def num(col):
+        values = df[col].to_numpy(dtype=float)
+        if col in ('3P%', 'FT%'): #no attempts, no percentage
+            return np.nan_to_num(values)
+        if col not in ('DRB', 'GS') and np.isnan(values).any():
+            raise ValueError(f'{col} has missing values' if col != 'MOV' else 'RESULT without a margin of victory')
+        return values
+    out = {col: num(col) for col in ['+/-', '3P', '3P%', '3PA', 'AST', 'BLK', 'DRB', 'FT', 'FT%', 'FTA', 'GS', 'ORB', 'PF', 'STL', 'TOV', 'MOV']}
+    out['MP'] = df['MP'].to_numpy(dtype=float)
+    out['AGE'] = df['AGE'].to_numpy(dtype=float)
+    out['2P'] = num('FG') - out['3P']
+    out['2PA'] = num('FGA') - out['3PA']
+    with np.errstate(divide='ignore', invalid='ignore'):
+        out['2P%'] = np.where(out['2PA'] == 0, 0, np.round(out['2P']/out['2PA'], 3))
+    out['HOME'] = (df['HOME/AWAY'] == 'HOME').to_numpy(dtype=float)
+    out['RESULT'] = (df['RESULT'] == 'W').to_numpy(dtype=float)
+    return pd.DataFrame(np.column_stack([out[col] for col in FEATURE_COLUMNS]).astype(np.float32).reshape(len(df), len(FEATURE_COLUMNS)), columns=FEATURE_COLUMNS)
+
+@instrument.timed('pre_allstar_data')
+def get_pre_allstar_data(name, season, num_games = 30):
     """
     Will get the gamelogs from the start of the season until the 30th game. Also cleans these gamelogs to give them all numeric values, removes certain categories that might not be useful in ML, and turns string fields into number fields.
 
     Args:
         name (str): Name of player whos ame you want
         season (int): Season to get the gamelogs from, from the first game of the season up to the 10th of January, inclusive.
+        num_games (int): how many of the team's games to take at most, None for every game before the all-star break
 
     Returns:
-        dataframe of games before Jan 10th, including categories ['AGE', 'HOME', 'RESULT', 'MP', '3P', '3PA', '3P%', 'FT', 'FTA', 'FT%', 'ORB', 'DRB', 'AST', 'STL', 'BLK', 'TOV', 'PF', '+/-', '2P', '2PA', '2P%', 'MOV']
+        dataframe of games before Jan 10th, including categories ['+/-', '2P', '2P%', '2PA', '3P', '3P%', '3PA', 'AGE', 'AST', 'BLK', 'DRB', 'FT', 'FT%', 'FTA', 'GS', 'HOME', 'MOV', 'MP', 'ORB', 'PF', 'RESULT', 'STL', 'TOV']
     """
-    def min_sec_to_frac_mins(st):
-        if st == 0: return 0
-        lst = st.split(':')
-        return round(int(lst[0]) + int(lst[1])/60,3)
-    def yr_day_to_frac_yrs(st):
-        lst = st.split('-')
-        return round(int(lst[0]) + int(lst[1])/365,3)
+    start_date, end_date = pre_allstar_window(season)
+    df = get_game_logs(name, start_date, end_date, num_games = num_games, season = season)
+    return featurize_game_log(df)
+
+def pre_allstar_window(season):
+    """Function to get the dates get_pre_allstar_data takes games from: from before the season starts to around the all-star break.
+
+    Args:
+        season (int): year the season ended
 
+    Returns:
+        (start_date, end_date) strings in format 'YYYY-MM-DD'
+    """
     start_date = '-'.join((str(season-1),'08', '01'))
     end_date = '-'.join((str(season),'02', '20'))
-    df = get_game_logs(name, start_date, end_date, num_games = 30)
-    df.rename(columns={'HOME/AWAY': "HOME", "Rk" : 'NUM_GAME'}, inplace = True)
-    df = df.astype({"FG": int,"FGA": int, "3P": int, "3PA": int, "FG%": float, "3P%": float, "FT": int, "FTA": int, "FT%": float, "ORB": int, "AST": int, "STL": int, "BLK": int, "TOV": int, "PF": int, "+/-": int, 'NUM_GAME': int})
-    df['2P'] = df['FG'] - df['3P']
-    df['2PA'] = df['FGA'] - df['3PA']
-    df['2P%'] = np.where(np.array(df['2PA'] == 0), 0, round(df['2P']/df['2PA'],3))
-    df['3P%'] = np.where(np.isnan(df['3P%']), 0, df['3P%'])
-    df['FT%'] = np.where(np.isnan(df['FT%']), 0, df['FT%'])
-    df2 = df['RESULT'].str.split(" ",expand=True)
-    df2.columns = ['RESULT','MOV']
-    df = df2.combine_first(df)
-    cols_to_del = ['DATE', 'TEAM', 'OPPONENT', 'GAME_SCORE', 'FG', 'FGA', 'FG%', 'TRB', 'PTS', 'NUM_GAME', 'G']
-    for col in cols_to_del:
-        del df[col]
-    df.reset_index(drop=True, inplace=True)
-    df['HOME'].replace(('HOME', 'AWAY'), (1,0), inplace=True)
-    df['RESULT'].replace(('W', 'L'), (1,0), inplace=True)
-    df['MP'] = df['MP'].apply(min_sec_to_frac_mins)
-    df['AGE'] = df['AGE'].apply(yr_day_to_frac_yrs)
-    df['MOV'] = df['MOV'].apply(lambda x : int(x[1:-1]))
-    return df
-
-def gen_d(start_year, end_year, mpg = 15, g = 30, v = False):
-    """Given a range of seasons, create a pickle file of a dataframe d. Dataframe d has, if player x met the season requirements in season y, a flattened record of x's first 30 games during season y. Return this dataframe
+    return start_date, end_date
+
+def gen_d(start_year, end_year, mpg = 15, g = 30, v = False, workers = None, resume = False, processes = None, num_games = 30, pad = None, report = None, all_star_source = None):
+    """Given a range of seasons, create a pickle file of a dataframe d. Dataframe d has, if player x met the season requirements in season y, a flattened record of x's first 30 games during season y. Return this dataframe. The same data is also saved as a memory-mappable float32 {name}_data.npy with a {name}_data.json sidecar (see dataset.load_dataset). The player lists always come from the season partitions (see generate_players.season_lists), never from a range list on disk, and a {name}_data from before partitions is rebuilt rather than reused.
 
     Args:
         start year (int): start of data query
@@ -119,9 +119,16 @@ def gen_d(start_year, end_year, mpg = 15, g = 30, v = False):
         mpg (int): minimum minutes per game for someone to be include in this list
         g (int): minimum games for someone to be include in this list
         v (bool): when True, print out extra things that'll tell us
+        workers (int): number of player-seasons scraped at the same time, fetch.WORKERS by default
+        resume (bool): when True, pick up the checkpoints left by an earlier run instead of starting over: finished player-seasons are skipped and failed ones retried
+        processes (int): when more than 1, build players in this many worker processes, see gen_seasons
+        num_games (int): games per row, datasets with another window than 30 get an '_n{num_games}' tag in their name
+        pad (float): value to pad players with fewer than num_games games with instead of dropping them, tagged '_pad{pad}' in the name
+        report (str): file to write instrument's timing and counters report to once the build is done, csv if it ends with .csv, json otherwise
+        all_star_source (str): where the labels come from, see utils.all_star_labels. Datasets labeled from the all-star game pages get a '_gamepage' tag in their name
 
     Returns:
-        dataframe with a players first 30 games
+        dataframe with a players first num_games games
 
     Todo:
         * I HAVE to clean up those argument names, otherwise it will kill me of confusion. Kept egtting exceptionerrors when i had it the same as in generate_players, so figure that out
@@ -131,42 +138,231 @@ def gen_d(start_year, end_year, mpg = 15, g = 30, v = False):
         name = f'{start_year}_mpg{mpg}_g{g}_playerlist'
     else:
         name = f'{start_year}-{end_year}_mpg{mpg}_g{g}_playerlist'
-    #try to load player names, otherwise generate player names, then load
+    #player lists always come from the season partitions: range lists from before them (2014_mpg15_g30_playerlist.p...) were made with G >= mpg
+    d = generate_players.season_lists(start_year, end_year, minimum_mpg = mpg, minimum_g = g, verbose = v)
+    tag = _dataset_tag(num_games, pad, all_star_source)
+    name += tag
+    #a range stacked from these partitions before is reused, a dataset from before partitions isn't. When resuming, not if a season of it still has failures to retry
+    if not (resume and any(_has_pending(f'{utils.partition_name(season, mpg, g)}{tag}_checkpoint.db', season) for season in d)) and _range_saved(name, d):
+        return pd.read_pickle(f'{name}_data')
+    #every season is built once into its own partition, a range is just the partitions stacked
+    matrices, problems = gen_seasons(d, mpg, g, v = v, workers = workers, resume = resume, processes = processes, num_games = num_games, pad = pad, all_star_source = all_star_source)
+    unfinished = [season for season in matrices if not _partition_saved(season, mpg, g, tag)]
+    builder = dataset.DatasetBuilder(num_games*len(FEATURE_COLUMNS), capacity=sum(len(matrix) for matrix in matrices.values()))
+    for matrix in matrices.values():
+        builder.extend(matrix)
+    if unfinished:
+        #the range would be loaded as finished next time, holes and all
+        print(f'seasons {unfinished} still have failures to retry, {name} is not saved until a run with --resume finishes them')
+        print(problems)
+        if report is not None:
+            instrument.save_report(report)
+        return builder.to_frame()
+    builder.save(name, {'start_year': start_year, 'end_year': end_year, 'mpg': mpg, 'g': g, 'num_games': num_games, 'pad': pad, 'all_star_source': all_star_source or utils.ALL_STAR_SOURCE, 'seasons': list(matrices), 'season_rows': [len(matrix) for matrix in matrices.values()]})
+    all_players_data = builder.to_frame()
+    all_players_data.to_pickle(f'{name}_data')
+    print(problems)
+    if report is not None:
+        instrument.save_report(report)
+    return all_players_data
+
+def _load_partition(season, mpg, g, tag=''):
+    """Function to load a season's dataset partition. Returns None if the season was never built. Single-season datasets from before partitions existed (e.g. 2014_mpg15_g30_playerlist_data) aren't adopted: their player lists were made with G >= mpg instead of g."""
     try:
-        d = utils.load_dict(name)
-    except:
-        generate_players.gen_p(name,start_year, end_year, minimum_mpg = mpg, minimum_g = g, verbose = v)
-        d = utils.load_dict(name)
-    #check of perchance this data already exists, otherwise just continue
+        return dataset.load_matrix(utils.partition_name(season, mpg, g) + tag)
+    except FileNotFoundError:
+        return None
+
+def _dataset_tag(num_games = 30, pad = None, all_star_source = None):
+    """Function to get what tells a dataset's name apart from the default one: its window (see dataset.window_tag), plus '_gamepage' when it is labeled from the all-star game pages instead of the players' pages."""
+    return dataset.window_tag(num_games, pad) + ('_gamepage' if (all_star_source or utils.ALL_STAR_SOURCE) == 'game_page' else '')
+
+def _range_saved(name, seasons):
+    """Function to check whether a range dataset was stacked from the season partitions of exactly these seasons, as gen_d saves them. Datasets from before partitions have no seasons in their sidecar (or no sidecar at all)."""
     try:
-        x = pd.read_pickle(f'{name}_data')
-    except Exception:
-        pass
-    else:
-        return x
-    #generate labeled player_seasons
-    all_players_data = pd.DataFrame()
-    problems = set()
-    for season in d.keys():
-        if v: print(f'starting on season: {season} \n num_players: {len(d[season])}') #vebrosity
-        #enumerate in case we want to stop it at a certain amount of people
-        for index, player in enumerate(d[season]):
-            if v: print(f'starting on player # {index}, {player}') #verbosity check
+        with open(f'{name}_data.json') as fp:
+            meta = json.load(fp)
+    except (OSError, ValueError):
+        return False
+    return meta.get('seasons') == list(seasons) and os.path.exists(f'{name}_data.npy') and os.path.exists(f'{name}_data')
+
+def _has_pending(progress_path, season):
+    """Function to check whether the checkpoint of a season still has failures worth retrying, without creating it if there is none."""
+    if not os.path.exists(progress_path):
+        return False
+    store = checkpoint.CheckpointStore(progress_path)
+    try:
+        return bool(store.pending(season))
+    finally:
+        store.close()
+
+def _partition_saved(season, mpg, g, tag=''):
+    """Function to check whether a season's partition was saved, i.e. it was built with nothing left to retry."""
+    return os.path.exists(f'{utils.partition_name(season, mpg, g)}{tag}_data.npy')
+
+def _init_worker(settings):
+    """Function run when a worker process starts, so it caches and rate limits like the process that started it, and only reports what it does itself."""
+    fetch.configure(**settings)
+    instrument.reset()
+
+def _build_player(player, seasons, num_games = 30, pad = None):
+    """Function to build one player's rows for several seasons in a row, dropping their gamelog pages from gamelogs.store once done.
+
+    Returns:
+        list of (season, suffix, flattened float32 features or None if the window isn't full and pad is None, error or None, whether the error is worth retrying), one per season
+    """
+    results = []
+    suffixes = set()
+    for season in seasons:
+        with instrument.season(season):
+            suffix = None
             try:
-                df = get_pre_allstar_data(player, season)
-            except Exception as e: #check to make sure they don't have the empty tables problem
-                problems.add((player, season, 'empty tables'))
+                #a name missing from the index refetches its pages, which can fail on the network like the gamelogs
+                suffix = utils.get_player_suffix(player, season)
+                suffixes.add(suffix)
+                df = get_pre_allstar_data(player, season, num_games)
+            except fetch.RETRYABLE_ERRORS as e: #offline, banned or the site is down: nothing wrong with the player, try again later
+                instrument.count('player_failures')
+                results.append((season, suffix, None, f'network: {e!r}', True))
                 continue
-            player_data = np.array(df).flatten()
-            if len(player_data) != 690: #23 categories x 30 games, not raising error because its supposed to be caught
+            except Exception as e: #check to make sure they don't have the empty tables problem
+                instrument.count('player_failures')
+                results.append((season, suffix, None, f'empty tables: {e!r}', False))
                 continue
-            if utils.was_all_star(player, season):
-                all_players_data = all_players_data.append(pd.Series(np.append(player_data, 1)), ignore_index = True)
+            player_data = features.window(df, num_games, pad) #None if short, not raising error because its supposed to be caught
+            instrument.count('players_built' if player_data is not None else 'short_windows')
+            results.append((season, suffix, player_data, None, False))
+    for suffix in suffixes:
+        gamelogs.store.evict(suffix)
+    return results
+
+def _build_shard(shard, num_games = 30, pad = None):
+    """Function run in a worker process: builds a list of (player, seasons) and packs the results so only one array and some small tuples get pickled back.
+
+    Returns:
+        (list of (season, suffix, has features, error, retryable) per player, (rows, num_games*23) float32 block of every window in order, what instrument recorded meanwhile)
+    """
+    keys, rows = [], []
+    for player, seasons in shard:
+        results = _build_player(player, seasons, num_games, pad)
+        keys.append([(season, suffix, player_data is not None, error, retryable) for season, suffix, player_data, error, retryable in results])
+        rows.extend(player_data for season, suffix, player_data, error, retryable in results if player_data is not None)
+    block = np.stack(rows) if rows else np.empty((0, num_games*len(FEATURE_COLUMNS)), dtype=np.float32)
+    return keys, block, instrument.take()
+
+def _unpack_shard(keys, block):
+    """Function to turn what _build_shard sent back into the results of _build_player, one list per player."""
+    rows = iter(block)
+    return [[(season, suffix, next(rows) if has_features else None, error, retryable) for season, suffix, has_features, error, retryable in player_keys] for player_keys in keys]
+
+def gen_seasons(d, mpg = 15, g = 30, v = False, workers = None, resume = False, processes = None, num_games = 30, pad = None, all_star_source = None):
+    """Given player lists for several seasons, return every season's labeled dataset, building only the seasons whose partition (see utils.partition_name) doesn't exist yet.
+
+    The work is split by player rather than by season: one worker builds all of a player's missing seasons in a row, so the gamelog pages their windows share are fetched and parsed once, and are dropped from gamelogs.store when the player is done.
+
+    Args:
+        d (dict): seasons (year the season ended) as keys, sets of players who met the requirements as values
+        mpg (int): minimum minutes per game the player lists were made with
+        g (int): minimum games the player lists were made with
+        v (bool): when True, print out extra things that'll tell us
+        workers (int): number of players scraped at the same time, fetch.WORKERS by default
+        resume (bool): when True, pick up the checkpoints left by an earlier run instead of starting over
+        processes (int): when more than 1, players are built in this many worker processes instead of threads, which pays off once the pages are cached and parsing is the bottleneck. The result is byte-identical either way.
+        num_games (int): games per row
+        pad (float): value to pad players with fewer than num_games games with, None drops them
+        all_star_source (str): where the labels come from, see utils.all_star_labels
+
+    Returns:
+        (dictionary of season -> (rows, num_games*23+1) float32 matrix with the target in the last column, in the order of d, set of (player, season, problem) that couldn't be built)
+    """
+    tag = _dataset_tag(num_games, pad, all_star_source)
+    width = num_games*len(FEATURE_COLUMNS)
+    matrices = {}
+    progress = {}
+    os.makedirs(utils.PARTITION_DIR, exist_ok=True) #for the checkpoints
+    for season in d.keys():
+        #every finished player-season is saved as soon as it's done, so a crash or a ban only loses the players in flight
+        progress_path = f'{utils.partition_name(season, mpg, g)}{tag}_checkpoint.db'
+        #a partition saved with failures still worth retrying (before they were told apart) isn't trusted when resuming
+        matrix = None if resume and _has_pending(progress_path, season) else _load_partition(season, mpg, g, tag)
+        if matrix is not None:
+            matrices[season] = matrix
+            continue
+        if not resume:
+            checkpoint.CheckpointStore.reset(progress_path)
+        progress[season] = checkpoint.CheckpointStore(progress_path)
+    player_seasons = {}
+    for season, season_progress in progress.items():
+        completed = season_progress.completed(season)
+        if v: print(f'season: {season} \n num_players: {len(d[season])}, already done: {len(completed)}') #vebrosity
+        for player in d[season]:
+            if player not in completed:
+                player_seasons.setdefault(player, []).append(season)
+    def record(player, results):
+        for season, suffix, player_data, error, retryable in results:
+            if error is not None:
+                progress[season].record_failure(season, player, error, retryable)
             else:
-                all_players_data = all_players_data.append(pd.Series(np.append(player_data, 0)), ignore_index = True)
-    all_players_data.columns = [*all_players_data.columns[:-1], 'target']
-    all_players_data.to_pickle(f'{name}_data')
-    print(problems)     
-    return all_players_data
+                progress[season].record(season, player, suffix, player_data)
+    todo = [(player, player_seasons[player]) for player in sorted(player_seasons)]
+    if processes is not None and processes > 1:
+        #cpu-bound once the pages are cached: shards of players go to worker processes, which send back one float32 block per shard
+        shards = [todo[i:i+SHARD_PLAYERS] for i in range(0, len(todo), SHARD_PLAYERS)]
+        settings = fetch.settings()
+        settings['rate'] /= processes #every process has its own rate limiter
+        utils.player_index() #built once here instead of once per process
+        with ProcessPoolExecutor(max_workers=processes, initializer=_init_worker, initargs=(settings,)) as pool:
+            for shard, (keys, block, recorded) in zip(shards, pool.map(_build_shard, shards, [num_games]*len(shards), [pad]*len(shards))):
+                instrument.merge(recorded)
+                for (player, seasons), results in zip(shard, _unpack_shard(keys, block)):
+                    record(player, results)
+    else:
+        def build_player(item):
+            player, seasons = item
+            if v: print(f'starting on player {player}, seasons {seasons}') #verbosity check
+            record(player, _build_player(player, seasons, num_games, pad))
+        fetch.map_ordered(build_player, todo, workers)
+    problems = set()
+    for season, season_progress in progress.items():
+        #rows come out in player order whatever order they finished in
+        rows = season_progress.rows(season, width)
+        builder = dataset.DatasetBuilder(width, capacity=len(rows))
+        for player, suffix, player_data in rows:
+            builder.append(player_data)
+        try:
+            with instrument.season(season):
+                builder.set_labels(0, utils.all_star_labels([suffix for _, suffix, _ in rows], season, all_star_source, workers))
+            labeled = True
+        except fetch.RETRYABLE_ERRORS as e:
+            print(f'{season}: the all-star labels failed on the network ({e!r}), run again with --resume to label it before the season is saved')
+            labeled = False
+        pending = season_progress.pending(season)
+        if pending:
+            print(f'{season}: {len(pending)} players failed on the network, run again with --resume to retry them before the season is saved')
+        if pending or not labeled:
+            #not saved as the season's partition: it would be trusted as finished and the missing players never retried
+            matrices[season] = builder.to_matrix()
+        else:
+            builder.save(utils.partition_name(season, mpg, g) + tag, {'start_year': season, 'end_year': season, 'mpg': mpg, 'g': g, 'num_games': num_games, 'pad': pad, 'all_star_source': all_star_source or utils.ALL_STAR_SOURCE, 'seasons': [season]})
+            matrices[season] = builder.to_matrix()
+        problems.update((player, season, error) for season, player, error, attempts in season_progress.failures())
+        season_progress.close()
+    return {season: matrices[season] for season in d.keys()}, problems
+
+def gen_season(season, players, mpg = 15, g = 30, v = False, workers = None, resume = False, processes = None, num_games = 30, pad = None, all_star_source = None):
+    """Given one season and its player list, return that season's labeled dataset, building it only if its partition doesn't exist yet. See gen_seasons.
+
+    Returns:
+        ((rows, num_games*23+1) float32 matrix with the target in the last column, set of (player, season, problem) that couldn't be built)
+    """
+    matrices, problems = gen_seasons({season: players}, mpg, g, v = v, workers = workers, resume = resume, processes = processes, num_games = num_games, pad = pad, all_star_source = all_star_source)
+    return matrices[season], problems
+
+def show(df):
+    """Function to look at a dataframe in the browser while debugging, tabloo is only imported when this is called."""
+    import tabloo
+    tabloo.show(df)
 
-print(gen_d(2000,2019,v=True))
+if __name__ == '__main__':
+    import cli
+    cli.main(['build-dataset'] + sys.argv[1:])
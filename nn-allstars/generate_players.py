@@ -2,29 +2,68 @@
 A module that generates a list of players that meet a certain set of criteria.
 
 Functions:
+    get_season_stats(season_end_year, data_format='PER_GAME', playoffs=False):
+        will return the whole league's per game stats for a season, downloaded once and shared by every team
+
     get_roster_stats(team, season_end_year, data_format='PER_GAME', playoffs=False):
         will return the roster for a given season for a given team, with basic per game stats
 
-    get_player_names(start_year, end_year, minimum_mpg = 15, minimum_g = 30, verbose = False):
+    get_player_names(start_year, end_year, minimum_mpg = 15, minimum_g = 30, verbose = False, workers = None):
         uses the get_roster_stats function to generate a list of players in specified seasons who meet certain criteria
 
-    gen(start_year, end_year, minimum_mpg = 15, minimum_g = 30, verbose = False):
-        puts it all together and generates a pickle file in the working directory with all the players
+    season_lists(start_year, end_year, minimum_mpg = 15, minimum_g = 30, verbose = False):
+        returns the players of every season in a range, from the season partitions, scraping only the seasons never built before
+
+    gen_p(name, start_year, end_year, minimum_mpg = 15, minimum_g = 30, verbose = False):
+        puts it all together and generates a pickle file in the working directory with all the players, reusing the season partitions that already exist
 
 Todo:
     * maybe check if pickle file already exists, put some metadata about years so we don't replicate calls too much
     * find some way to reduce those ugly arguments in gen
     * all the Todos within functions
 """
+import os
 import pandas as pd
+import fetch
+import tables
 import utils
 
-from requests import get
-from basketball_reference_scraper.teams import get_roster
+from fetch import get
 from basketball_reference_scraper.constants import TEAM_TO_TEAM_ABBR
-from bs4 import BeautifulSoup
 
 
+_season_stats = {}
+
+def get_season_stats(season_end_year, data_format='PER_GAME', playoffs=False):
+    """Function to load the league-wide stats table for a season. The page is only downloaded and parsed once per season, every team's roster is a slice of it.
+
+    Args:
+        season_end_year (int): year the season ended. e.g, for 2009-2010 season, input 2010.
+        data_format ('PER_GAME', ?): formats for the outputted data
+        playoffs (bool): whether to make the data frm the playoffs that year, or not
+
+    Returns:
+        Dataframe with one row per player stint (traded players also get a 'TOT' row), with the same columns as get_roster_stats, or None if the page couldn't be loaded. Don't modify it in place, it is shared between callers.
+    """
+    key = (season_end_year, data_format, playoffs)
+    if key in _season_stats:
+        return _season_stats[key]
+    if playoffs:
+        period = 'playoffs'
+    else:
+        period = 'leagues'
+    selector = data_format.lower()
+    r = fetch.check_status(get(f'https://widgets.sports-reference.com/wg.fcgi?css=1&site=bbr&url=%2F{period}%2FNBA_{season_end_year}_{selector}.html&div=div_{selector}_stats')) #a 429 raises instead of being remembered as a season without stats
+    df = None
+    if r.status_code==200:
+        df = tables.read_table(r.content) #the header the table repeats every 20 rows is already dropped
+        df = df.rename(columns = {'Player': 'PLAYER', 'Age': 'AGE', 'Tm': 'TEAM', 'Pos': 'POS'})
+        df['PLAYER'] = utils.prune_weird_names_series(df['PLAYER'])
+        df['SEASON'] = f'{season_end_year-1}-{str(season_end_year)[2:]}'
+        df = df.drop(['Rk'], axis=1).reset_index(drop=True)
+    _season_stats[key] = df
+    return df
+
 def get_roster_stats(team, season_end_year, data_format='PER_GAME', playoffs=False):
     """Function to load a team's roster for a specific year, and return it with the per game stats.
 
@@ -42,29 +81,12 @@ def get_roster_stats(team, season_end_year, data_format='PER_GAME', playoffs=Fal
     Todo:
         *Figure out what other data_formats you can have
     """
-    if playoffs:
-        period = 'playoffs'
-    else:
-        period = 'leagues'
-    selector = data_format.lower()
-    r = get(f'https://widgets.sports-reference.com/wg.fcgi?css=1&site=bbr&url=%2F{period}%2FNBA_{season_end_year}_{selector}.html&div=div_{selector}_stats')
-    df = None
-    if r.status_code==200:
-        soup = BeautifulSoup(r.content, 'html.parser')
-        table = soup.find('table')
-        df2 = pd.read_html(str(table))[0]
-        for index, row in df2.iterrows():
-            if row['Tm']==team:
-                if df is None:
-                    df = pd.DataFrame(columns=list(row.index)+['SEASON'])
-                row['Player'] = utils.prune_weird_names(row['Player'])
-                row['SEASON'] = f'{season_end_year-1}-{str(season_end_year)[2:]}'
-                df = df.append(row)
-        df.rename(columns = {'Player': 'PLAYER', 'Age': 'AGE', 'Tm': 'TEAM', 'Pos': 'POS'}, inplace=True)
-        df = df.reset_index().drop(['Rk', 'index'], axis=1)
-        return df
-
-def get_player_names(start_year, end_year, minimum_mpg = 15, minimum_g = 30, verbose = False):
+    df = get_season_stats(season_end_year, data_format, playoffs)
+    if df is None:
+        return None
+    return df[df['TEAM']==team].reset_index(drop=True)
+
+def get_player_names(start_year, end_year, minimum_mpg = 15, minimum_g = 30, verbose = False, workers = None):
     """Given a range of seasons, return all the players meting the minutes per game and game requirements
 
     Args:
@@ -74,6 +96,7 @@ def get_player_names(start_year, end_year, minimum_mpg = 15, minimum_g = 30, ver
         minimum_mpg (int): minimum minutes per game for someone to be include in this list
         minimum_g (int): minimum games for someone to be include in this list
         verbose (bool): when True, print out when the function moves on to the next year
+        workers (int): number of seasons fetched at the same time, fetch.WORKERS by default
 
     Returns:
         Dictionary with seasons (year the season ended) as keys and a set of players who meet the requirements as values
@@ -81,30 +104,62 @@ def get_player_names(start_year, end_year, minimum_mpg = 15, minimum_g = 30, ver
     Todo:
         *Figure out how **kwargs work to allow users to put unlimited filters
     """
-    year_players = {}
-    for year in range(start_year,end_year+1,1):
-        if year == 2012: continue #this season had a lockout, better not include weird data
+    years = [year for year in range(start_year,end_year+1,1) if year != 2012] #2012 had a lockout, better not include weird data
+    return _season_player_names(years, minimum_mpg, minimum_g, verbose, workers)
+
+def _season_player_names(years, minimum_mpg, minimum_g, verbose, workers, strict = False):
+    """Function doing the work of get_player_names for an explicit list of seasons. With strict, a season whose stats couldn't be loaded gets the exception instead of an empty set, so it can't be mistaken for a season where nobody qualified."""
+    teams = list(dict.fromkeys(TEAM_TO_TEAM_ABBR.values()))
+    def season_player_names(year):
         if verbose:
             print(f'Status: starting on {year}')
-        all_players_names = set()
-        already = set()
-        for team in list(TEAM_TO_TEAM_ABBR.values()):
-            if team in already: continue
-            try:
-                rs = get_roster_stats(team,year)
-            except:
-                continue
+        try:
+            rs = get_season_stats(year)
+        except Exception as e:
+            return e if strict else set()
+        if rs is None:
+            return LookupError(f'no per game stats page for {year}') if strict else set()
+        #one mask over the whole league: only stints with a real team (no 'TOT' rows) that meet both minimums
+        qualified = rs['TEAM'].isin(teams) & (pd.to_numeric(rs['MP'], errors='coerce') >= minimum_mpg) & (pd.to_numeric(rs['G'], errors='coerce') >= minimum_g)
+        return set(rs.loc[qualified, 'PLAYER'])
+    results = fetch.map_ordered(season_player_names, years, workers)
+    return dict(zip(years, results))
+
+def season_lists(start_year, end_year, minimum_mpg = 15, minimum_g = 30, verbose = False):
+    """Given a range of seasons, return the players meeting the requirements in every season, read from the season partitions (see utils.partition_name). Only seasons that were never built before are scraped, and each one is saved as its partition the first time. A season whose stats can't be loaded gets no partition, so a later run tries it again. Range lists (e.g. 2000-2019_mpg15_g30_playerlist.p) are never read here: the ones from before partitions were made with G >= minimum_mpg instead of minimum_g.
+
+    Args:
+        start year (int): start of data query
+        end_year (int): end of data query
+        minimum_mpg (int): minimum minutes per game for someone to be include in this list
+        minimum_g (int): minimum games for someone to be include in this list
+        verbose (bool): when True, print out when the function moves on to the next year
+
+    Returns:
+        Dictionary with seasons (year the season ended) as keys and a set of players who meet the requirements as values
+
+    Raises:
+        LookupError: if the stats of a season to scrape couldn't be loaded, after the other seasons are saved
+    """
+    #every season is its own partition, only the ones nobody built yet get scraped
+    years = [year for year in range(start_year,end_year+1,1) if year != 2012]
+    partitions = {year: utils.partition_name(year, minimum_mpg, minimum_g) for year in years}
+    missing = [year for year in years if not os.path.exists(f'{partitions[year]}.p')]
+    if missing:
+        if verbose: print(f'Status: scraping seasons {missing}')
+        failed = {}
+        for year, players in _season_player_names(missing, minimum_mpg, minimum_g, verbose, None, strict = True).items():
+            if isinstance(players, Exception):
+                failed[year] = players
             else:
-                roster_stats_filtered = rs.loc[(rs['MP'].astype(float) >= minimum_mpg)&(rs['G'].astype(float) >= minimum_mpg)]
-                team_player_names = list(roster_stats_filtered['PLAYER'])
-                team_player_names = list(map(utils.prune_weird_names, team_player_names))
-                all_players_names.update(team_player_names)
-                already.add(team)
-        year_players[year] = all_players_names
-    return year_players
+                utils.save_dict(players, partitions[year])
+        if failed:
+            #an empty partition would be reused as if nobody qualified that season
+            raise LookupError(f'could not get the per game stats of seasons {sorted(failed)}, nothing saved for them: {failed}')
+    return {year: utils.load_dict(partitions[year]) for year in years}
 
 def gen_p(name,start_year, end_year, minimum_mpg = 15, minimum_g = 30, verbose = False):
-    """Given a filename and a range of seasons, create a pickle file of a dictionary containing all the players meting the minutes per game and game requirements
+    """Given a filename and a range of seasons, create a pickle file of a dictionary containing all the players meting the minutes per game and game requirements. The seasons come from season_lists, so only seasons that were never built before are scraped.
 
     Args:
         name (str): The name of the pickle file to be saved
@@ -118,8 +173,10 @@ def gen_p(name,start_year, end_year, minimum_mpg = 15, minimum_g = 30, verbose =
     Returns:
         None
 
+    Raises:
+        LookupError: if the stats of a season to scrape couldn't be loaded, after the other seasons are saved
+
     Todo:
         * Is there an way to not make the arguments of this the exact same as those of the above function??
     """
-    x = get_player_names(start_year, end_year, minimum_mpg, minimum_g, verbose)
-    utils.save_dict(x,name)
+    utils.save_dict(season_lists(start_year, end_year, minimum_mpg, minimum_g, verbose), name)
@@ -0,0 +1,206 @@
+"""
+A module that records where a build spends its time: how long every stage takes (player lookups, gamelog fetches,
+featurizing, dataset appends...) and, per season, how many requests went out, how many bytes came back, how many were
+served from the cache and how many failed.
+
+Stages are timed with the timed decorator or the stage context manager, and counters go to the season set with the
+season context manager on the current thread, so work done on fetch's thread pool is attributed to the right season.
+Worker processes send their numbers back with take() and the parent merges them.
+
+Functions:
+    timed(name):
+        decorator timing every call of a function as the stage name
+
+    stage(name):
+        context manager timing a block as the stage name
+
+    season(season):
+        context manager attributing the counts made on this thread to a season
+
+    count(name, n=1):
+        will add n to a counter of the current season
+
+    report():
+        will return the timings as a histogram per stage and the counters per season
+
+    save_report(path):
+        will write the report as json, or csv if path ends with .csv
+
+    profile(path=None):
+        context manager running a block under cProfile, dumping the stats to path
+
+    take(), merge(snapshot), reset():
+        will hand over, add up and clear the raw numbers
+
+Todo:
+    * a live progress line instead of the v=True prints
+"""
+import cProfile
+import csv
+import functools
+import json
+import threading
+import time
+
+from collections import defaultdict
+from contextlib import contextmanager
+
+import numpy as np
+
+BUCKETS = [1e-4, 1e-3, 1e-2, 0.1, 1.0, 10.0, 100.0] #upper bounds in seconds of the histogram buckets, anything slower goes in the last one
+
+_lock = threading.Lock()
+_local = threading.local()
+_durations = defaultdict(list) #stage -> seconds of every call
+_counters = defaultdict(lambda: defaultdict(int)) #season (None outside of one) -> counter -> value
+
+
+def _record(name, seconds):
+    with _lock:
+        _durations[name].append(seconds)
+
+
+@contextmanager
+def stage(name):
+    """Context manager timing the block it wraps as one call of the stage name, whether it raises or not."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _record(name, time.perf_counter() - start)
+
+
+def timed(name):
+    """Decorator timing every call of the function as one call of the stage name."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                _record(name, time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def season(season):
+    """Context manager attributing every count made on this thread inside it to season."""
+    previous = getattr(_local, 'season', None)
+    _local.season = season
+    try:
+        yield
+    finally:
+        _local.season = previous
+
+
+def count(name, n=1):
+    """Function to add n to the counter name of the season set on this thread (see season), or of no season.
+
+    Args:
+        name (str): counter, e.g. 'requests' or 'cache_hits'
+        n (int): how much to add
+
+    Returns:
+        None
+    """
+    key = getattr(_local, 'season', None)
+    with _lock:
+        _counters[key][name] += n
+
+
+def _histogram(durations):
+    edges = [0.0] + BUCKETS
+    counts = np.histogram(np.minimum(durations, BUCKETS[-1]), bins=edges)[0]
+    return {f'<={bound:g}s': int(n) for bound, n in zip(BUCKETS, counts)}
+
+
+def report():
+    """
+    Will summarize everything recorded so far.
+
+    Returns:
+        dictionary with 'stages': stage -> calls, total/mean/p50/p95/max seconds and a histogram of the calls per bucket of BUCKETS,
+        'seasons': season -> counters, and 'totals': the counters added up over every season
+    """
+    with _lock:
+        durations = {name: np.array(values) for name, values in _durations.items()}
+        counters = {key: dict(values) for key, values in _counters.items()}
+    stages = {}
+    for name, values in sorted(durations.items()):
+        stages[name] = {'calls': len(values), 'total_s': float(values.sum()), 'mean_s': float(values.mean()),
+                        'p50_s': float(np.percentile(values, 50)), 'p95_s': float(np.percentile(values, 95)), 'max_s': float(values.max()),
+                        'histogram': _histogram(values)}
+    totals = defaultdict(int)
+    for values in counters.values():
+        for name, n in values.items():
+            totals[name] += n
+    seasons = {('none' if key is None else str(key)): values for key, values in sorted(counters.items(), key=lambda kv: (kv[0] is None, str(kv[0])))}
+    return {'stages': stages, 'seasons': seasons, 'totals': dict(totals)}
+
+
+def save_report(path):
+    """Function to write report() to path, as json, or as csv rows of (section, key, metric, value) if path ends with .csv.
+
+    Args:
+        path (str): file to write
+
+    Returns:
+        the report
+    """
+    rep = report()
+    if path.endswith('.csv'):
+        with open(path, 'w', newline='') as fp:
+            writer = csv.writer(fp)
+            writer.writerow(['section', 'key', 'metric', 'value'])
+            for name, summary in rep['stages'].items():
+                for metric, value in summary.items():
+                    if metric == 'histogram':
+                        writer.writerows(['stage', name, bucket, n] for bucket, n in value.items())
+                    else:
+                        writer.writerow(['stage', name, metric, value])
+            for key, values in rep['seasons'].items():
+                writer.writerows(['season', key, name, n] for name, n in sorted(values.items()))
+            writer.writerows(['total', '', name, n] for name, n in sorted(rep['totals'].items()))
+    else:
+        with open(path, 'w') as fp:
+            json.dump(rep, fp, indent=1)
+    return rep
+
+
+@contextmanager
+def profile(path=None):
+    """Context manager running the block under cProfile. The stats are dumped to path (for pstats or snakeviz) if given, and the profiler is yielded either way."""
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield profiler
+    finally:
+        profiler.disable()
+        if path is not None:
+            profiler.dump_stats(path)
+
+
+def take():
+    """Function to get the raw numbers recorded so far and clear them, e.g. to send them from a worker process to the parent."""
+    with _lock:
+        snapshot = {'durations': dict(_durations), 'counters': {key: dict(values) for key, values in _counters.items()}}
+        _durations.clear()
+        _counters.clear()
+    return snapshot
+
+
+def merge(snapshot):
+    """Function to add numbers handed over by take() to the ones recorded here."""
+    with _lock:
+        for name, values in snapshot['durations'].items():
+            _durations[name].extend(values)
+        for key, values in snapshot['counters'].items():
+            for name, n in values.items():
+                _counters[key][name] += n
+
+
+def reset():
+    """Function to clear everything recorded so far."""
+    take()
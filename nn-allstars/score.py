@@ -0,0 +1,206 @@
+"""
+A module to score every qualifying player of a season with a trained model, e.g. the season being played right now.
+
+Every player's window is built with generate_data.get_pre_allstar_data and features.window, as many games and padded the
+same way as the dataset the model was trained on (the sidecar export_model writes says which), and all of them are scored
+with a single model.predict call. Windows are cached per season and window ({season}_score_features{tag}.p) along with a
+digest of the gamelog pages they were cut from, so rescoring after new games only rebuilds the players whose pages
+changed. For a live season, set a short fetch ttl so the pages are refetched at all.
+
+Run it as a script (or `python cli.py score`), e.g. `python score.py 2020 --model models/allstars.keras --ttl 3600`, to print the ranking.
+
+Models are saved in the native .keras format, which needs TensorFlow 2.12 or later. That is the only format
+Keras 3 (TensorFlow 2.16 and later) saves and loads with model.save and load_model. Old SavedModel directories have
+to be exported again with `python cli.py train --export`.
+
+Functions:
+    export_model(model, path=MODEL_PATH, metadata=None):
+        will save a trained model as a .keras file, with a json sidecar describing it
+
+    load_model(path=MODEL_PATH):
+        will load a model saved with export_model
+
+    model_metadata(path=MODEL_PATH):
+        will return the sidecar of a model saved with export_model
+
+    season_features(season, players, workers=None, cache=True, num_games=30, pad=None):
+        will return the feature rows of a season's players, rebuilding only the ones whose gamelogs changed
+
+    score_season(model, season, mpg=15, g=30, workers=None, cache=True, num_games=30, pad=None):
+        will return the all-star probability of every qualifying player of a season
+
+Todo:
+    * the player list itself is cached as long as the season stats page is, it should follow the same ttl
+"""
+import hashlib
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+import dataset
+import fetch
+import features
+import gamelogs
+import generate_data
+import generate_players
+import utils
+
+MODEL_PATH = 'models/allstars.keras'
+MODEL_EXTENSION = '.keras'
+
+
+def export_model(model, path=MODEL_PATH, metadata=None):
+    """Function to save a trained model as a .keras file at path, plus a json sidecar next to it (models/allstars.json for models/allstars.keras) with what it expects as input.
+
+    Args:
+        model: trained keras model, outputting logits
+        path (str): file to save it in, .keras is added if it doesn't end with it
+        metadata (dict): extra fields for the sidecar, e.g. the dataset it was trained on. Its num_games and pad (30 and None by default) must be the window of that dataset, scoring builds its windows from them.
+
+    Returns:
+        the metadata that was written
+    """
+    meta = {'num_games': 30, 'pad': None, 'output': 'logits', 'created': time.strftime('%Y-%m-%d %H:%M:%S')}
+    meta.update(metadata or {})
+    meta['feature_names'] = dataset.feature_names(meta['num_games'])
+    path = _model_file(path)
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    model.save(path)
+    with open(_sidecar(path), 'w') as fp:
+        json.dump(meta, fp, indent=1)
+    return meta
+
+
+def load_model(path=MODEL_PATH):
+    """Function to load a model saved with export_model.
+
+    Args:
+        path (str): file it was saved in, .keras is added if it doesn't end with it
+
+    Returns:
+        keras model
+    """
+    import tensorflow as tf #only needed here, building features doesn't need it
+    return tf.keras.models.load_model(_model_file(path))
+
+
+def model_metadata(path=MODEL_PATH):
+    """Function to read the sidecar export_model wrote next to a model. Sidecars written before windows could change get the 30-game, unpadded window they were trained on.
+
+    Args:
+        path (str): file the model was saved in
+
+    Returns:
+        dictionary with at least num_games and pad
+    """
+    with open(_sidecar(_model_file(path))) as fp:
+        meta = json.load(fp)
+    meta.setdefault('num_games', 30)
+    meta.setdefault('pad', None)
+    return meta
+
+
+def _model_file(path):
+    """Function to add the .keras extension to a model path without one, keras 3 won't save or load anything else."""
+    return path if path.endswith(MODEL_EXTENSION) else f'{path}{MODEL_EXTENSION}'
+
+
+def _sidecar(path):
+    """Function to get the json sidecar of a .keras model file, the same file the SavedModel directory of the same name had."""
+    return f'{path[:-len(MODEL_EXTENSION)]}.json'
+
+
+def _pages_digest(suffix, season):
+    """Function to get a digest of every gamelog page a player's window for a season is cut out of."""
+    digest = hashlib.sha1(str(suffix).encode('utf-8'))
+    if suffix is not None:
+        for year in gamelogs.page_years(*generate_data.pre_allstar_window(season)):
+            r = fetch.get(gamelogs.page_url(suffix, year))
+            digest.update(f'{year}:{r.status_code}:'.encode('utf-8'))
+            digest.update(r.content)
+    return digest.hexdigest()
+
+
+def season_features(season, players, workers=None, cache=True, num_games=30, pad=None):
+    """
+    Will get the feature row of every player of a season, windowed like the datasets built with the same num_games and pad. With cache, rows are saved per season with the digest of the pages they were built from, and a player is only rebuilt when that digest changed.
+
+    Args:
+        season (int): year the season ends
+        players (iterable): names of the players
+        workers (int): number of players built at the same time, fetch.WORKERS by default
+        cache (bool): whether to use and update the season's feature cache
+        num_games (int): games per row
+        pad (float): value short windows are padded with, None leaves players without num_games games out
+
+    Returns:
+        (list of the players sorted, list of the same length with a (num_games*23,) float32 row or None when the player doesn't have a full window (or failed on the network), number of players that were rebuilt)
+    """
+    name = f'{season}_score_features{dataset.window_tag(num_games, pad)}'
+    try:
+        cached = utils.load_dict(name) if cache else {}
+    except OSError:
+        cached = {}
+    players = sorted(players)
+    def player_features(player):
+        try:
+            #a name missing from the index refetches its pages, the gamelogs are fetched for the digest: both can fail on the network
+            suffix = utils.get_player_suffix(player, season)
+            digest = _pages_digest(suffix, season)
+        except fetch.RETRYABLE_ERRORS:
+            return None, None, False
+        if player in cached and cached[player][0] == digest:
+            return digest, cached[player][1], False
+        gamelogs.store.evict(suffix) #parsed from the pages just fetched, not the ones from the last scoring
+        try:
+            row = features.window(generate_data.get_pre_allstar_data(player, season, num_games), num_games, pad) #None with fewer than num_games games so far
+        except Exception: #no gamelog, or a broken one
+            row = None
+        return digest, row, True
+    results = fetch.map_ordered(player_features, players, workers)
+    rebuilt = sum(changed for _, _, changed in results)
+    failed = sum(digest is None for digest, _, _ in results)
+    if failed:
+        print(f'{season}: {failed} players failed on the network, they get no score until a later run')
+    if cache and rebuilt:
+        cached.update({player: (digest, row) for player, (digest, row, _) in zip(players, results) if digest is not None})
+        utils.save_dict(cached, name)
+    return players, [row for _, row, _ in results], rebuilt
+
+
+def score_season(model, season, mpg=15, g=30, workers=None, cache=True, num_games=30, pad=None):
+    """
+    Will score every player of a season who meets the minutes and games requirements so far. Windows have to match the ones the model was trained on, pass the num_games and pad of its sidecar (see model_metadata). Without pad, players who haven't played num_games games yet can't be scored and get a NaN probability.
+
+    Args:
+        model: model loaded with load_model (or fresh out of work.train), outputting logits
+        season (int): year the season ends
+        mpg (int): minimum minutes per game
+        g (int): minimum games
+        workers (int): number of players built at the same time, fetch.WORKERS by default
+        cache (bool): whether to use the season's feature cache, see season_features
+        num_games (int): games per row the model takes
+        pad (float): value the model's dataset padded short windows with, None if it dropped them
+
+    Returns:
+        dataframe with columns ['PLAYER', 'SUFFIX', 'PROBABILITY'], most likely all-stars first
+    """
+    players = generate_players.get_player_names(season, season, minimum_mpg = mpg, minimum_g = g, workers = workers).get(season, set())
+    players, rows, rebuilt = season_features(season, players, workers, cache, num_games, pad)
+    scored = [i for i, row in enumerate(rows) if row is not None]
+    probability = np.full(len(players), np.nan)
+    if scored:
+        logits = model.predict(np.stack([rows[i] for i in scored]), batch_size=max(len(scored), 1), verbose=0)
+        probability[scored] = 1/(1 + np.exp(-np.asarray(logits, dtype=np.float64).reshape(-1)))
+    print(f'{season}: {len(scored)} of {len(players)} players scored, {rebuilt} rebuilt')
+    df = pd.DataFrame({'PLAYER': players, 'SUFFIX': [utils.get_player_suffix(player, season) for player in players], 'PROBABILITY': probability})
+    return df.sort_values('PROBABILITY', ascending=False, na_position='last', kind='mergesort').reset_index(drop=True)
+
+
+if __name__ == '__main__':
+    import cli
+    cli.main(['score'] + sys.argv[1:])
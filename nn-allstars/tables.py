@@ -0,0 +1,149 @@
+"""
+A module that pulls tables out of sports-reference pages in a single pass.
+
+The old way was BeautifulSoup(html.parser) to find the table, str(table) to serialize it again, then pd.read_html to parse
+it a second time. Here the page is parsed once with lxml and the cells are read straight off the tree. Tables come out
+the way pd.read_html gives them (same column names, 'Unnamed: i' for empty headers, colspans repeated across the columns
+they cover), except that the header rows sports-reference repeats every 20 rows are dropped and columns that are all
+numbers are already numeric.
+
+Functions:
+    parse(content):
+        will parse a page into an lxml tree
+
+    find_table(root, table_id=None):
+        will return a table element of a parsed page
+
+    read_table(content, table_id=None, typed=True):
+        will return a table of a page as a dataframe
+
+    column_links(content, data_stat, table_ids=None):
+        will return the link of every cell with a given data-stat in every table (or the given tables) of a page
+
+Todo:
+    * thead with several rows (over_header) only keeps the last one, read_html would make a MultiIndex
+"""
+import lxml.html
+import numpy as np
+import pandas as pd
+
+
+def parse(content):
+    """Function to parse a page (bytes or str) into an lxml tree, the same tree can be passed to the other functions to read several things out of it."""
+    if isinstance(content, (bytes, str)):
+        return lxml.html.fromstring(content)
+    return content
+
+
+def find_table(root, table_id=None):
+    """Function to get a table out of a page.
+
+    Args:
+        root: page as bytes, str or an already parsed tree
+        table_id (str): id of the table, the first table of the page if None
+
+    Returns:
+        lxml element of the table, or None if there is no such table
+    """
+    root = parse(root)
+    if root.tag == 'table' and table_id in (None, root.get('id')):
+        return root
+    if table_id is None:
+        tables = root.iter('table')
+    else:
+        tables = root.xpath('//table[@id=$id]', id=table_id)
+    return next(iter(tables), None)
+
+
+def _cells(tr):
+    """Function to get the text of a row's cells, with a colspan cell repeated over every column it covers like read_html does."""
+    values = []
+    for cell in tr:
+        if cell.tag not in ('td', 'th'):
+            continue
+        text = cell.text_content().strip()
+        try:
+            span = int(cell.get('colspan', 1))
+        except ValueError:
+            span = 1
+        values.extend([text or None]*max(span, 1))
+    return values
+
+
+def _is_header_row(tr):
+    return 'thead' in (tr.get('class') or '').split() or all(cell.tag == 'th' for cell in tr if cell.tag in ('td', 'th'))
+
+
+def _column_names(header):
+    """Function to name columns like read_html does: empty headers become 'Unnamed: i' and repeated ones get a '.1', '.2'... suffix."""
+    names, seen = [], {}
+    for i, name in enumerate(header):
+        name = name if name else f'Unnamed: {i}'
+        if name in seen:
+            seen[name] += 1
+            name = f'{name}.{seen[name]}'
+        else:
+            seen[name] = 0
+        names.append(name)
+    return names
+
+
+def read_table(content, table_id=None, typed=True):
+    """
+    Will read a table of a page into a dataframe in one pass over the page. The header comes from the last row of thead (or the leading rows made only of th cells if there is no thead), and header rows repeated in the body are skipped.
+
+    Args:
+        content: page as bytes, str or an already parsed tree
+        table_id (str): id of the table, the first table of the page if None
+        typed (bool): when True, columns where every value is a number are converted to numbers, the rest stay strings. Empty cells are NaN either way.
+
+    Returns:
+        dataframe of the table, or None if the page has no such table
+    """
+    table = find_table(content, table_id)
+    if table is None:
+        return None
+    header, rows = None, []
+    for tr in table.iter('tr'):
+        in_thead = tr.getparent().tag == 'thead'
+        if in_thead or (not rows and _is_header_row(tr)):
+            header = _cells(tr)
+            continue
+        if _is_header_row(tr):
+            continue
+        values = _cells(tr)
+        if values:
+            rows.append(values)
+    if header is None:
+        header = [None]*max((len(row) for row in rows), default=0)
+    width = max([len(header)] + [len(row) for row in rows])
+    header = header + [None]*(width - len(header))
+    data = np.full((len(rows), width), np.nan, dtype=object)
+    for i, row in enumerate(rows):
+        data[i, :len(row)] = [np.nan if value is None else value for value in row]
+    columns = {}
+    for name, values in zip(_column_names(header), data.T):
+        if typed:
+            try:
+                values = pd.to_numeric(values)
+            except (ValueError, TypeError):
+                pass
+        columns[name] = values
+    return pd.DataFrame(columns, index=range(len(rows)))
+
+
+def column_links(content, data_stat, table_ids=None):
+    """Function to get the href of the link in every cell with a given data-stat (e.g. 'player'), in every table of the page, in page order.
+
+    Args:
+        content: page as bytes, str or an already parsed tree
+        data_stat (str): data-stat attribute of the cells to look at
+        table_ids (list): only look in the tables with these ids, every table if None
+
+    Returns:
+        list of hrefs
+    """
+    root = parse(content)
+    if table_ids is None:
+        return root.xpath('//table//*[@data-stat=$stat]/a/@href', stat=data_stat)
+    return [href for table_id in table_ids for href in root.xpath('//table[@id=$id]//*[@data-stat=$stat]/a/@href', id=table_id, stat=data_stat)]
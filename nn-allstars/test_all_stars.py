@@ -0,0 +1,112 @@
+"""
+Tests of the all-star labels, on small pages stored in a throwaway http cache, so nothing here touches basketball-reference.
+
+Run them with `python -m pytest test_all_stars.py` from this folder.
+
+Functions:
+    test_game_page_roster / test_game_page_missing_season:
+        only the two box scores (Did Not Play rows included) and their footer notes count, not the contests or the rest of the page, and a season without a game has nobody
+
+    test_player_pages / test_sources_agree_on_made_up_pages:
+        the per-player all-star tables give the labels the checked-in datasets were made with, and both sources agree on consistent pages
+
+    test_recorded_season:
+        both sources agree on a real recorded season, skipped until fixtures recorded with benchmark.py --record are checked in
+
+Todo:
+    * check in a recorded real season under fixtures/ (benchmark.py --record), test_recorded_season skips without it
+"""
+import json
+import os
+
+import pytest
+
+import fetch
+import utils
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), fetch.FIXTURE_DIR)
+GAME_PAGE = 'https://www.basketball-reference.com/allstar/NBA_2014.html'
+BOX = '<thead><tr><th data-stat="player">Starters</th><th data-stat="mp">MP</th></tr></thead>'
+
+
+def _row(suffix, cell='<td data-stat="mp">20:00</td>'):
+    return f'<tr><th data-stat="player"><a href="{suffix}">x</a></th>{cell}</tr>'
+
+
+def _selections(seasons):
+    rows = ''.join(f'<tr><th>{season}</th><td>East</td></tr>' for season in seasons)
+    return f'<div><table id="all_star"><thead><tr><th>Season</th><th>Conf</th></tr></thead><tbody>{rows}</tbody></table></div>'.encode()
+
+
+def _widget(suffix):
+    name_code = suffix.replace('/players/', '')[2:]
+    return f'https://widgets.sports-reference.com/wg.fcgi?css=1&site=bbr&url=%2Fplayers%2F{name_code[0]}%2F{name_code}&div=div_all_star'
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    """Function to give an empty offline http cache for the test to store pages in."""
+    monkeypatch.setattr(fetch, '_cache', fetch.ResponseCache(str(tmp_path / 'cache'), ttl=None))
+    monkeypatch.setattr(fetch, 'OFFLINE', True)
+    monkeypatch.setattr(fetch, 'FIXTURE_MODE', None)
+    monkeypatch.setattr(utils, '_all_star_seasons', {})
+    return fetch._cache
+
+
+def test_game_page_roster(cache):
+    page = (f'<table id="line_score"><tr><th>East</th><td>155</td></tr></table>'
+            f'<table id="East">{BOX}<tbody>{_row("/players/a/east01.html")}{_row("/players/a/sat01.html", "<td data-stat=reason>Did Not Play</td>")}</tbody></table>'
+            f'<div id="tfooter_East">Injured: <a href="/players/a/hurt01.html">x</a>, replaced by <a href="/players/a/repl01.html">y</a></div>'
+            f'<!--<table id="West">{BOX}<tbody>{_row("/players/a/west01.html")}</tbody></table>-->'
+            f'<!--<table id="three_point"><tbody>{_row("/players/a/shooter01.html", "<td data-stat=pts>20</td>")}</tbody></table>-->'
+            f'<p>The injured <a href="/players/a/news01.html">z</a> skipped the dunk contest</p>'
+            f'<ul><li>Did not play: <a href="/players/a/nav01.html">w</a></li></ul>')
+    cache.store(fetch.Response(GAME_PAGE, 200, page.encode()))
+    assert utils._all_star_suffixes(2014) == {'/players/a/east01.html', '/players/a/sat01.html', '/players/a/hurt01.html', '/players/a/repl01.html', '/players/a/west01.html'}
+
+
+def test_game_page_missing_season(cache):
+    cache.store(fetch.Response('https://www.basketball-reference.com/allstar/NBA_1999.html', 404, b''))
+    assert utils.all_star_labels(['/players/a/east01.html'], 1999, 'game_page') == [False]
+
+
+def test_player_pages(cache):
+    cache.store(fetch.Response(_widget('/players/j/jamesle01.html'), 200, _selections(['2012-13', '2013-14'])))
+    cache.store(fetch.Response(_widget('/players/d/davisan02.html'), 200, _selections(['2014-15'])))
+    cache.store(fetch.Response(_widget('/players/r/rookie01.html'), 200, b'<div></div>'))
+    suffixes = ['/players/j/jamesle01.html', '/players/d/davisan02.html', '/players/r/rookie01.html', None]
+    assert utils.all_star_labels(suffixes, 2014, 'player_pages', workers=1) == [True, False, False, False]
+    assert utils.all_star_labels(suffixes, 2015, 'player_pages', workers=1) == [False, True, False, False]
+    with pytest.raises(ValueError):
+        utils.all_star_labels(suffixes, 2014, 'box_scores')
+
+
+def test_sources_agree_on_made_up_pages(cache):
+    stars, others = ['/players/a/star01.html', '/players/b/star02.html'], ['/players/c/bench01.html']
+    for suffix in stars:
+        cache.store(fetch.Response(_widget(suffix), 200, _selections(['2013-14'])))
+    cache.store(fetch.Response(_widget(others[0]), 200, b'<div></div>'))
+    cache.store(fetch.Response(GAME_PAGE, 200, f'<table id="East">{BOX}<tbody>{"".join(map(_row, stars))}</tbody></table>'.encode()))
+    assert utils.all_star_labels(stars + others, 2014, 'game_page') == utils.all_star_labels(stars + others, 2014, 'player_pages', workers=1) == [True, True, False]
+
+
+def _recorded():
+    try:
+        with open(os.path.join(FIXTURES, 'fixtures.json')) as fp:
+            manifest = json.load(fp)
+    except OSError:
+        return None
+    return None if manifest.get('made_up') else manifest
+
+
+@pytest.mark.skipif(_recorded() is None, reason='no real season recorded in fixtures/ (benchmark.py --record)')
+def test_recorded_season(tmp_path, monkeypatch):
+    manifest = _recorded()
+    monkeypatch.setattr(fetch, '_fixtures', fetch.ResponseCache(FIXTURES, ttl=None, max_bytes=float('inf')))
+    monkeypatch.setattr(fetch, 'FIXTURE_MODE', 'replay')
+    monkeypatch.setattr(utils, '_all_star_seasons', {})
+    monkeypatch.setattr(utils, '_player_index', None)
+    monkeypatch.chdir(tmp_path) #the player index is rebuilt from the recorded index pages
+    season = manifest['season']
+    suffixes = [utils.get_player_suffix(player, season) for player in manifest['players']]
+    assert utils.all_star_labels(suffixes, season, 'game_page') == utils.all_star_labels(suffixes, season, 'player_pages', workers=1)
@@ -0,0 +1,57 @@
+"""
+Tests of features.window, on games cut back out of the checked-in 2014 dataset and on small made-up arrays.
+
+Run them with `python -m pytest test_features.py` from this folder.
+
+Functions:
+    test_full_window_is_the_dataset_row:
+        30 games of a dataset row flatten back into exactly that row
+
+    test_short_window / test_padded_window / test_long_window:
+        short windows are rejected without pad and padded with it, longer ones keep only the first num_games games
+
+Todo:
+    * nothing for now
+"""
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import features
+
+from dataset import GAME_FEATURES
+
+DATASET = os.path.join(os.path.dirname(os.path.abspath(__file__)), '2014_mpg15_g30_playerlist_data')
+
+
+def _games(count):
+    return np.arange(count*len(GAME_FEATURES), dtype=np.float64).reshape(count, len(GAME_FEATURES))
+
+
+def test_full_window_is_the_dataset_row():
+    rows = pd.read_pickle(DATASET).drop(columns=['target']).to_numpy(dtype=np.float32)[:20]
+    for row in rows:
+        games = pd.DataFrame(row.reshape(30, len(GAME_FEATURES)), columns=GAME_FEATURES)
+        window = features.window(games)
+        assert window.dtype == np.float32
+        assert np.array_equal(window, row)
+
+
+def test_short_window():
+    assert features.window(_games(12)) is None
+    assert features.window(_games(12), num_games=12).shape == (12*len(GAME_FEATURES),)
+
+
+@pytest.mark.parametrize('pad', [0.0, -1.0])
+def test_padded_window(pad):
+    window = features.window(_games(3), num_games=5, pad=pad).reshape(5, len(GAME_FEATURES))
+    assert np.array_equal(window[:3], _games(3))
+    assert (window[3:] == pad).all()
+
+
+def test_long_window():
+    games = _games(40)
+    window = features.window(games, num_games=10, pad=0.0)
+    assert np.array_equal(window, games[:10].reshape(-1).astype(np.float32))
@@ -0,0 +1,288 @@
+"""
+Tests of fetch against a local http.server running on a thread, so nothing here touches basketball-reference.
+
+Run them with `python -m pytest test_fetch.py` from this folder.
+
+Functions:
+    test_fetch_all_keeps_order / test_map_ordered_keeps_order:
+        results come back in the order of the inputs, not the order they finish in
+
+    test_rate_limit_spaces_requests_to_a_host / test_rate_limit_is_per_host:
+        requests to one host are spaced out by 1/rate, requests to another host don't wait on them
+
+    test_retry_after_is_honoured / test_5xx_is_retried / test_backoff_doubles:
+        429 and 5xx responses are retried with a backoff that doubles, waiting at least as long as Retry-After says
+
+    test_gives_up_after_retries / test_404_is_not_retried:
+        after RETRIES the last response is returned (and not cached), a 404 is an answer and isn't retried
+
+    test_record_keeps_only_answers:
+        record mode saves pages and 404s as fixtures, not a 503 left after the retries
+
+    test_cache_hits_and_misses / test_stale_entry_is_refetched / test_offline_allows_stale / test_offline_uncached_url:
+        the counters of ResponseCache, its ttl online and offline, and OfflineError for a page that was never fetched
+
+    test_eviction_by_last_use / test_corrupt_entry_is_a_miss:
+        over max_bytes the least recently used entries go until the cache is down to 90% of it, an unreadable entry counts as a miss
+
+Todo:
+    * tests of replay mode
+"""
+import http.server
+import os
+import threading
+import time
+
+import pytest
+
+import fetch
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    """
+    Serves:
+        /slow/{key}/{seconds}: the key, after sleeping that long
+        /flaky/{key}/{status}/{failures}/{retry_after}: that status (with that Retry-After, if not 'none') the first `failures` times, then the key
+        anything else: the path
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.hits.append((self.path, time.monotonic()))
+            count = sum(path == self.path for path, _ in server.hits)
+        parts = self.path.strip('/').split('/')
+        body = self.path.encode()
+        if parts[0] == 'slow':
+            time.sleep(float(parts[2]))
+            body = parts[1].encode()
+        elif parts[0] == 'flaky' and count <= int(parts[3]):
+            self.send_response(int(parts[2]))
+            if parts[4] != 'none':
+                self.send_header('Retry-After', parts[4])
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        elif parts[0] == 'flaky':
+            body = parts[1].encode()
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture(scope='module')
+def server():
+    httpd = http.server.ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+    httpd.daemon_threads = True
+    httpd.lock = threading.Lock()
+    httpd.hits = []
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture
+def base(server, tmp_path, monkeypatch):
+    """Function to point fetch at an empty cache, online, without fixtures, no rate limit to speak of and short backoffs, and give the server's url."""
+    monkeypatch.setattr(fetch, '_cache', fetch.ResponseCache(str(tmp_path / 'cache')))
+    monkeypatch.setattr(fetch, '_limiter', fetch.RateLimiter(1000))
+    monkeypatch.setattr(fetch, 'OFFLINE', False)
+    monkeypatch.setattr(fetch, 'FIXTURE_MODE', None)
+    monkeypatch.setattr(fetch, 'RETRIES', 3)
+    monkeypatch.setattr(fetch, 'BACKOFF', 0.01)
+    with server.lock:
+        server.hits.clear()
+    return f'http://127.0.0.1:{server.server_address[1]}'
+
+
+def _hit_times(server, prefix):
+    with server.lock:
+        return [at for path, at in server.hits if path.startswith(prefix)]
+
+
+def test_fetch_all_keeps_order(base):
+    #the first urls are the slowest, so they finish last
+    urls = [f'{base}/slow/{i}/{0.05*(5-i)}' for i in range(6)]
+    responses = fetch.fetch_all(urls, workers=6)
+    assert [r.url for r in responses] == urls
+    assert [r.content for r in responses] == [str(i).encode() for i in range(6)]
+
+
+def test_map_ordered_keeps_order():
+    finished = []
+
+    def work(i):
+        time.sleep(0.02*(5-i))
+        finished.append(i)
+        return i*i
+
+    assert fetch.map_ordered(work, range(6), workers=6) == [i*i for i in range(6)]
+    assert finished != sorted(finished)
+    assert fetch.map_ordered(work, range(6), workers=1) == [i*i for i in range(6)]
+
+
+def test_rate_limit_spaces_requests_to_a_host(base, server, monkeypatch):
+    monkeypatch.setattr(fetch, '_limiter', fetch.RateLimiter(10))
+    fetch.fetch_all([f'{base}/spaced/{i}' for i in range(5)], workers=5)
+    times = sorted(_hit_times(server, '/spaced/'))
+    assert len(times) == 5
+    #0.1 s apart when they leave, a new connection can eat a little of that on the way
+    assert times[-1] - times[0] >= 0.35
+    assert min(b - a for a, b in zip(times, times[1:])) >= 0.07
+
+
+def test_rate_limit_is_per_host():
+    limiter = fetch.RateLimiter(5)
+    times = {'a': [], 'b': []}
+    lock = threading.Lock()
+
+    def request(host):
+        limiter.wait(host)
+        with lock:
+            times[host].append(time.monotonic())
+
+    threads = [threading.Thread(target=request, args=(host,)) for _ in range(3) for host in 'ab']
+    start = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for host in 'ab':
+        spaced = sorted(times[host])
+        assert [round(at - start, 1) for at in spaced] == [0.0, 0.2, 0.4]
+    #with a shared limit the six requests would take a whole second
+    assert max(times['a'] + times['b']) - start < 0.6
+
+
+def test_retry_after_is_honoured(base, server):
+    r = fetch.get(f'{base}/flaky/after/429/2/0.3')
+    assert (r.status_code, r.content) == (200, b'after')
+    times = _hit_times(server, '/flaky/after/')
+    assert len(times) == 3
+    #Retry-After is much longer than the backoff, every retry waited for it
+    assert min(b - a for a, b in zip(times, times[1:])) >= 0.29
+
+
+def test_5xx_is_retried(base, server):
+    for status in (500, 502, 503, 504):
+        r = fetch.get(f'{base}/flaky/s{status}/{status}/1/none')
+        assert (r.status_code, r.content) == (200, f's{status}'.encode())
+        assert len(_hit_times(server, f'/flaky/s{status}/')) == 2
+
+
+def test_backoff_doubles(base, server, monkeypatch):
+    monkeypatch.setattr(fetch, 'BACKOFF', 0.1)
+    fetch.get(f'{base}/flaky/doubles/503/3/none')
+    times = _hit_times(server, '/flaky/doubles/')
+    gaps = [b - a for a, b in zip(times, times[1:])]
+    assert len(gaps) == 3
+    assert gaps[0] >= 0.09 and gaps[1] >= 0.19 and gaps[2] >= 0.39
+
+
+def test_gives_up_after_retries(base, server):
+    url = f'{base}/flaky/gives_up/503/100/none'
+    r = fetch.get(url)
+    assert r.status_code == 503
+    assert len(_hit_times(server, '/flaky/gives_up/')) == fetch.RETRIES+1
+    with pytest.raises(fetch.StatusError):
+        fetch.check_status(r)
+    #a 503 is never cached, the next get asks again
+    fetch.get(url)
+    assert len(_hit_times(server, '/flaky/gives_up/')) == 2*(fetch.RETRIES+1)
+
+
+def test_404_is_not_retried(base, server):
+    r = fetch.get(f'{base}/flaky/missing/404/100/none')
+    assert r.status_code == 404
+    assert len(_hit_times(server, '/flaky/missing/')) == 1
+    assert fetch.check_status(r) is r
+
+
+def test_record_keeps_only_answers(base, tmp_path, monkeypatch):
+    fixtures = fetch.ResponseCache(str(tmp_path / 'fixtures'), ttl=None)
+    monkeypatch.setattr(fetch, '_fixtures', fixtures)
+    monkeypatch.setattr(fetch, 'FIXTURE_MODE', 'record')
+    urls = [f'{base}/recorded', f'{base}/flaky/gone/404/100/none', f'{base}/flaky/down/503/100/none']
+    assert [fetch.get(url).status_code for url in urls] == [200, 404, 503]
+    assert [fixtures.lookup(url) is not None for url in urls] == [True, True, False]
+
+
+def _stale(url, content=b'old'):
+    return fetch.Response(url, 200, content, fetched_at=time.time()-120)
+
+
+def test_cache_hits_and_misses(tmp_path):
+    cache = fetch.ResponseCache(str(tmp_path / 'cache'))
+    assert cache.lookup('http://x/a') is None
+    cache.store(fetch.Response('http://x/a', 200, b'a'))
+    assert cache.lookup('http://x/a').content == b'a'
+    assert cache.lookup('http://x/a').content == b'a'
+    assert cache.counters == {'hits': 2, 'misses': 1, 'stale': 0, 'evictions': 0}
+    #a new cache on the same folder finds what the last one stored
+    assert fetch.ResponseCache(str(tmp_path / 'cache')).lookup('http://x/a').content == b'a'
+
+
+def test_stale_entry_is_refetched(base, server, tmp_path, monkeypatch):
+    cache = fetch.ResponseCache(str(tmp_path / 'ttl'), ttl=60)
+    monkeypatch.setattr(fetch, '_cache', cache)
+    url = f'{base}/refetched'
+    cache.store(_stale(url))
+    assert fetch.get(url).content == b'/refetched'
+    assert len(_hit_times(server, '/refetched')) == 1
+    assert cache.counters['stale'] == 1
+    #the fresh page replaced the stale one
+    assert fetch.get(url).content == b'/refetched'
+    assert len(_hit_times(server, '/refetched')) == 1
+
+
+def test_offline_allows_stale(tmp_path, monkeypatch):
+    cache = fetch.ResponseCache(str(tmp_path / 'cache'), ttl=60)
+    cache.store(_stale('http://x/old'))
+    assert cache.lookup('http://x/old') is None
+    assert cache.lookup('http://x/old', allow_stale=True).content == b'old'
+    monkeypatch.setattr(fetch, '_cache', cache)
+    monkeypatch.setattr(fetch, 'OFFLINE', True)
+    monkeypatch.setattr(fetch, 'FIXTURE_MODE', None)
+    assert fetch.get('http://x/old').content == b'old'
+
+
+def test_offline_uncached_url(tmp_path, monkeypatch):
+    monkeypatch.setattr(fetch, '_cache', fetch.ResponseCache(str(tmp_path / 'cache')))
+    monkeypatch.setattr(fetch, 'OFFLINE', True)
+    monkeypatch.setattr(fetch, 'FIXTURE_MODE', None)
+    with pytest.raises(fetch.OfflineError):
+        fetch.get('http://x/never')
+
+
+def test_eviction_by_last_use(tmp_path):
+    cache = fetch.ResponseCache(str(tmp_path / 'cache'), max_bytes=float('inf'))
+    urls = [f'http://x/{name}' for name in 'abcdef']
+    for url in urls[:5]:
+        cache.store(fetch.Response(url, 200, b'x'*1000))
+    entry = max(os.path.getsize(cache._path(cache.key(url))) for url in urls[:5])
+    cache.lookup(urls[0]) #a is now the most recently used
+    #six entries is over 4.5 of them, two have to go to get under 90% of that
+    cache.max_bytes = int(4.5*entry)
+    cache.store(fetch.Response(urls[5], 200, b'x'*1000))
+    assert cache.counters['evictions'] == 2
+    assert [os.path.exists(cache._path(cache.key(url))) for url in urls] == [True, False, False, True, True, True]
+    assert cache.size() <= 0.9*cache.max_bytes
+
+
+def test_corrupt_entry_is_a_miss(tmp_path):
+    cache = fetch.ResponseCache(str(tmp_path / 'cache'))
+    cache.store(fetch.Response('http://x/corrupt', 200, b'page'))
+    with open(cache._path(cache.key('http://x/corrupt')), 'wb') as fp:
+        fp.write(b'not a pickle')
+    assert cache.lookup('http://x/corrupt') is None
+    assert cache.counters['misses'] == 1
+    #dropped from the index, so the next lookup doesn't try to read it again
+    assert cache.lookup('http://x/corrupt') is None
+    assert cache.counters['misses'] == 2 and cache.size() == 0
@@ -8,25 +8,53 @@ Functions:
     load_dict(name):
         will load a dictionary as a pickle file
 
+    partition_name(season, mpg, g):
+        will return the name under which one season's player list and dataset are stored
+
     prune_weird_names(st):
         given a string, returns a copy of the string without weird characters
 
-    was_all_star(name, season):
+    prune_weird_names_series(names):
+        same thing for a whole column of names, each distinct name is only cleaned once
+
+    was_all_star(name, season, source=None):
         given a player name and a season, returns whether they were an all star
 
+    all_star_labels(suffixes, season, source=None, workers=None):
+        given player suffixes and a season, returns whether each of them was an all star, from their pages or the all-star game page
+
+    get_all_stars(start_year, end_year):
+        given a range of seasons, returns every (player suffix, season) selection on the all-star game rosters
+
+    player_index():
+        returns the player index, building it the first time it is needed
+
+    get_player_suffix(name, season=None):
+        given a player name, returns their bbref suffix using a prebuilt index of the /players/{initial} pages
+
+    refresh_player_index(letters):
+        rebuilds the parts of the player index whose pages changed
+
 Todo:
     * Decide what could best fit in this utils category
 """
+import fetch
+import functools
+import hashlib
+import instrument
+import os
 import pandas as pd
 import pickle
+import re
+import tables
+import threading
+import time
 import unicodedata
 
-from bs4 import BeautifulSoup
-from requests import get
-from basketball_reference_scraper.utils import get_player_suffix
+from fetch import fetch_all, get
 
 def save_dict(d,name):
-    """Function to save dictionary as a pickle file in current directory, with given name.
+    """Function to save dictionary as a pickle file in current directory, with given name. A folder in the name (e.g. a season partition) is made if it doesn't exist.
 
     Args:
         d (dict): Dictionary to be saved as a pickle file.
@@ -35,6 +63,8 @@ def save_dict(d,name):
     Returns:
         None
     """
+    if os.path.dirname(name):
+        os.makedirs(os.path.dirname(name), exist_ok=True)
     with open(f'{name}.p', 'wb') as fp:
         pickle.dump(d, fp, protocol=pickle.HIGHEST_PROTOCOL)
 
@@ -50,8 +80,45 @@ def load_dict(name):
     with open(f'{name}.p', 'rb') as fp:
         return pickle.load(fp)
 
+PARTITION_DIR = 'seasons'
+
+def partition_name(season, mpg, g):
+    """Function to get the name of a season partition: every season's player list and dataset are built once and stored under it, and any range of seasons is put together from them.
+
+    Args:
+        season (int): year the season ended
+        mpg (int): minimum minutes per game of the player list
+        g (int): minimum games of the player list
+
+    Returns:
+        name like 'seasons/2014_mpg15_g30_playerlist', to use with save_dict/load_dict or dataset.load_dataset
+    """
+    return os.path.join(PARTITION_DIR, f'{season}_mpg{mpg}_g{g}_playerlist')
+
+#letters NFKD doesn't split into a base letter plus accents
+_ASCII_LETTERS = str.maketrans({'ı': 'i', 'ł': 'l', 'Ł': 'L', 'ø': 'o', 'Ø': 'O', 'đ': 'd', 'Đ': 'D', 'ð': 'd', 'þ': 'th', 'ß': 'ss', 'æ': 'ae', 'Æ': 'AE', 'œ': 'oe', 'Œ': 'OE'})
+#windows-1252 characters back to the byte they were decoded from, so that encoding as latin-1 gives the original bytes
+_CP1252_BYTES = {ord(bytes([byte]).decode('cp1252')): byte for byte in range(0x80, 0xa0) if byte not in (0x81, 0x8d, 0x8f, 0x90, 0x9d)}
+_SPECIAL_NAMES = {'Juan Carlos Navarro': 'JuanCarlos Navarro'} #how bbref's index has them
+
+def _repair_mojibake(st):
+    """Function to undo utf-8 text that was decoded as windows-1252 (e.g. 'DragiÄ‡' -> 'Dragić'). Bytes 1252 doesn't define come out as the latin-1 control characters, those are mapped back too, and so is a no-break space that got turned into a plain one ('Å aric' -> 'Šaric'). Anything that doesn't round trip is returned as is."""
+    try:
+        raw = st.translate(_CP1252_BYTES).encode('latin-1')
+    except UnicodeEncodeError:
+        return st
+    try:
+        return raw.decode('utf-8')
+    except UnicodeDecodeError:
+        pass
+    try:
+        return re.sub(rb'([\xc2-\xdf]) ', b'\\1\xa0', raw).decode('utf-8')
+    except UnicodeDecodeError:
+        return st
+
+@functools.lru_cache(maxsize=None)
 def prune_weird_names(st):
-    """Function to replace weird characters in names with their latin language equivalents.
+    """Function to replace weird characters in names with their latin language equivalents, in one pass: mojibake is repaired first ('Ã©' -> 'é'), then accents are folded away ('é' -> 'e'). Names are cached since the same players come up every season.
 
     Args:
         st (str): String to replace foreign characters from.
@@ -60,93 +127,282 @@ def prune_weird_names(st):
         string with weird characters removed and normal letters inserted
 
     Todo:
-        *not make this so hardcoded lol. I tried to do a bunch of stuff with encodings when reading the data but it just doesn't work.
-        *track new weird names if they come into NBA. Current character lists are based on 2000-2019 seasons
-    """
-    st = st.replace('Ã–', 'o')
-    st = st.replace('Å½', 'z')
-    st = st.replace('Å¾', 'z')
-    st = st.replace('Å†', 'n')
-    st = st.replace('Ä£', 'g')
+        *track new weird names if they come into NBA, the letters NFKD can't fold are in _ASCII_LETTERS
+    """
+    if not st.isascii():
+        st = unicodedata.normalize('NFKD', _repair_mojibake(st).translate(_ASCII_LETTERS))
+        st = st.encode('ascii', 'ignore').decode('ascii')
     st = st.replace('*', '')
-    st = st.replace('Juan Carlos Navarro', 'JuanCarlos Navarro')
-    st = st.replace('Ã©', 'e')
-    st = st.replace('Ã¡', 'a')
-    st = st.replace('Ä‡', 'c')
-    st = st.replace('Ä', 'c')
-    st = st.replace('Ã¼', 'u')
-    st = st.replace('ÄŸ', 'g')
-    st = st.replace('Ã³', 'o')
-    st = st.replace('Ã¶', 'o')
-    st = st.replace('Ã¤', 'a')
-    st = st.replace('Ãª', 'e')
-    st = st.replace('Å™', 'r')
-    st = st.replace('Ã­-', 'o')
-    st = st.replace('Ã£', 'a')
-    st = st.replace('Ã«', 'e')
-    st = st.replace('Å¡', 's')
-    st = st.replace('Å ', 's')
-    st = st.replace('Å«', 'u')
-    st = st.replace('Ä°', 'i')
-    st = st.replace('Ã½', 'y')
-    st = st.replace('ÅŸ', 's')
-    st = st.replace('Ä±', 'i')
-    st = st.replace('Ã§', 'c')
-    st = st.replace('Ã', 'a' )
-    st = st.replace('Ã­', 'i')
-    st = st.replace('Ã¨', 'e')
-    st = st.replace('Ä', 'a')
-    st = st.replace('Å½iÅ¾iÄ‡', 'Zizic')
-    return st
-
-def was_all_star(name, season):
+    return _SPECIAL_NAMES.get(st, st)
+
+def prune_weird_names_series(names):
+    """Function to run prune_weird_names over a column of names, once per distinct name.
+
+    Args:
+        names (Series): names to clean, anything that isn't a string is left alone
+
+    Returns:
+        Series of cleaned names with the same index
+    """
+    unique = [name for name in names.unique() if isinstance(name, str)]
+    return names.map(dict(zip(unique, map(prune_weird_names, unique)))).fillna(names)
+
+_all_star_seasons = {}
+ALL_STAR_SOURCES = ('player_pages', 'game_page')
+#the checked-in datasets were labeled from every player's all-star table. The game page is one request per season instead
+#of one per player, but it stays opt-in until benchmark.py --check-all-stars agrees with the player pages on a real season
+ALL_STAR_SOURCE = 'player_pages'
+ALL_STAR_NOTES = ('did not play', 'injur', 'replac') #notes under the box scores naming selections who sat out, and who took their place
+
+def _all_star_table_ids(root):
+    """Function to get the ids of the two team box scores of an all-star game page: the first two tables with a minutes column. The other tables of the page (contests, leaders, the line score) have none, and the players in them weren't all necessarily all-stars."""
+    ids = []
+    for table_id in root.xpath('//table[@id][.//*[@data-stat="mp"]]/@id'):
+        if table_id not in ids:
+            ids.append(table_id)
+    return ids[:2]
+
+def _all_star_roster(content):
+    """Function to get the suffixes of everyone on the two rosters of an all-star game page: every row of the box scores, the ones that say Did Not Play included, and the players named in the box scores' footer notes (tfooter_{table id}) about injured selections and their replacements."""
+    #some tables are shipped inside html comments, uncomment them so the parser sees them
+    root = tables.parse(content.replace(b'<!--', b'').replace(b'-->', b''))
+    table_ids = _all_star_table_ids(root)
+    hrefs = tables.column_links(root, 'player', table_ids)
+    lower = 'translate(string(.), "ABCDEFGHIJKLMNOPQRSTUVWXYZ", "abcdefghijklmnopqrstuvwxyz")'
+    notes = ' or '.join(f'contains({lower}, "{note}")' for note in ALL_STAR_NOTES)
+    for table_id in table_ids:
+        hrefs += root.xpath(f'//*[@id=$footer][{notes}]//a/@href', footer=f'tfooter_{table_id}')
+    return {href for href in hrefs if href.startswith('/players/')}
+
+def _all_star_suffixes(season):
+    """Function to get the set of bbref suffixes of everyone on an all-star roster in a given season, fetched once per season. A season without a game (404) has nobody."""
+    if season not in _all_star_seasons:
+        r = fetch.check_status(get(f'https://www.basketball-reference.com/allstar/NBA_{season}.html'))
+        _all_star_seasons[season] = _all_star_roster(r.content) if r.status_code==200 else set()
+    return _all_star_seasons[season]
+
+def _player_all_star_seasons(suffix):
+    """Function to get the seasons ('2013-14'...) in the all-star table of a player's page, read from its widget like the checked-in datasets were labeled. No table means no selection."""
+    name_code = suffix.replace('/players/', '')[2:]
+    r = fetch.check_status(get(f'https://widgets.sports-reference.com/wg.fcgi?css=1&site=bbr&url=%2Fplayers%2F{name_code[0]}%2F{name_code}&div=div_all_star'))
+    if r.status_code!=200 or tables.find_table(r.content) is None:
+        return set()
+    df = tables.read_table(r.content, typed=False)
+    return set(df['Season'].astype(str)) if 'Season' in df else set()
+
+@instrument.timed('all_stars')
+def all_star_labels(suffixes, season, source=None, workers=None):
+    """
+    Will tell, for every player suffix, whether that player was an all-star in the season that ends on the year given.
+
+    Args:
+        suffixes (list): bbref suffixes of the players, None counts as not an all-star
+        season (int): year the season ended
+        source (str): 'player_pages' reads every player's all-star table, 'game_page' the rosters of the season's all-star game page (one request for the whole season). ALL_STAR_SOURCE if None.
+        workers (int): number of player pages fetched at the same time, fetch.WORKERS by default
+
+    Returns:
+        list of bools, one per suffix
+    """
+    source = source or ALL_STAR_SOURCE
+    if source == 'game_page':
+        roster = _all_star_suffixes(season)
+        return [suffix in roster for suffix in suffixes]
+    if source != 'player_pages':
+        raise ValueError(f'source must be one of {ALL_STAR_SOURCES}, not {source!r}')
+    season_str = '{}-{}'.format(season-1, str(season)[-2:])
+    return fetch.map_ordered(lambda suffix: suffix is not None and season_str in _player_all_star_seasons(suffix), suffixes, workers)
+
+@instrument.timed('all_stars')
+def get_all_stars(start_year, end_year):
+    """
+    Will get every (player suffix, season) pair where the player was on that season's all-star game roster, reading one all-star game page per season. See all_star_labels for labeling given players.
+
+    Args:
+        start_year (int): first season (year the season ended) to load
+        end_year (int): last season (year the season ended) to load
+
+    Returns:
+        dataframe with columns ['SUFFIX', 'SEASON'], one row per all-star selection
+    """
+    rows = [(suffix, season) for season in range(start_year, end_year+1) for suffix in sorted(_all_star_suffixes(season))]
+    return pd.DataFrame(rows, columns=['SUFFIX', 'SEASON'])
+
+@instrument.timed('was_all_star')
+def was_all_star(name, season, source=None):
     """
     Will tell you whether a player had an all-star season in the season that ends on the year given (i.e. if you pass 2018 it will tell you whether the player was an all-star in the 2017-2018 season)
 
     Args:
         name (str): Name of player whos ame you want
         season (int): Season to check if the player was an all-star
+        source (str): where to read it from, see all_star_labels
 
     Returns:
         all-star: True if player was an all-star, False otherwise
    """
-    name_code = get_player_suffix(name).replace('/players/', '')
-    name_code = name_code[2:]
-    last_initial = name_code[0]
-    selector = 'div_all_star'
-    url = f'https://widgets.sports-reference.com/wg.fcgi?css=1&site=bbr&url=%2Fplayers%2F{last_initial}%2F{name_code}&div={selector}'
-    r = get(url)
-    if r.status_code==200:
-        soup = BeautifulSoup(r.content, 'html.parser')
-        table = soup.find('table')
-        try:
-            df = pd.read_html(str(table))[0]
-        except ValueError:
-            return False
-        all_star_seasons = list(str(x) for x in list(df['Season']))
-        season_in_question = '{}-{}'.format(season-1,str(season)[-2:])
-        if season_in_question in all_star_seasons:
-            return True
-        return False
-    else:
-        return False
+    return all_star_labels([get_player_suffix(name, season)], season, source, workers=1)[0]
+
+PLAYER_INDEX_NAME = 'player_index'
+PLAYER_INDEX_LETTERS = 'abcdefghijklmnopqrstuvwxyz'
+PLAYER_INDEX_VERSION = 2 #bump when normalize_name changes, an index saved with another version is rebuilt
+_player_index = None
+_player_index_lock = threading.RLock() #lookups come from many threads at once, only one of them should build the index
+_letters_refreshed = {} #initial -> when a lookup miss last refreshed its page in this process
+
+def normalize_name(name):
+    """Function to turn a name into the key used by the player index: cleaned with prune_weird_names, lowercase, single spaces.
+
+    Args:
+        name (str): Name to normalize.
+
+    Returns:
+        normalized string
+    """
+    return ' '.join(prune_weird_names(name).lower().split())
+
+def _parse_player_index_page(content):
+    """Function to parse a /players/{initial} page into (normalized name, suffix, first season, last season) tuples, in page order."""
+    entries = []
+    table = tables.find_table(content, 'players')
+    if table is None:
+        return entries
+    for row in table.iter('tr'):
+        anchors = row.xpath('./*[@data-stat="player"]//a[@href]')
+        if not anchors:
+            continue
+        years = []
+        for stat in ('year_min', 'year_max'):
+            try:
+                years.append(int(row.xpath('string(./td[@data-stat=$stat])', stat=stat)))
+            except ValueError:
+                years.append(None)
+        entries.append((normalize_name(anchors[0].text_content()), anchors[0].get('href'), years[0], years[1]))
+    return entries
+
+def _index_names(entries):
+    names = {}
+    for letter in sorted(entries):
+        for norm, suffix, year_min, year_max in entries[letter]:
+            names.setdefault(norm, []).append((suffix, year_min, year_max))
+    return names
 
-def get_player_suffix(name):
+def refresh_player_index(letters=PLAYER_INDEX_LETTERS):
     """
-    Quick 1-liner given that its a simple function. Given a name, return the bbref suffix that allows us to find their information. holy SHIT this took me so long to figure out.
+    Will (re)build the name -> bbref suffix index from the /players/{initial} pages. A letter is only re-parsed when its page changed since the last build, and the index is saved as a pickle so later runs don't have to build it again.
+
+    Args:
+        letters (str): Initials to refresh, all of them by default.
+
+    Returns:
+        the index, a dictionary with the page digests, the raw entries per letter and the names lookup table
     """
-    normalized_name = unicodedata.normalize('NFD', name).encode('ascii', 'ignore').decode("utf-8")
-    names = normalized_name.split(' ')[1:]
-    for last_name in names:
-        initial = last_name[0].lower()
-        r = get(f'https://www.basketball-reference.com/players/{initial}')
-        if r.status_code==200:
-            soup = BeautifulSoup(r.content, 'html.parser')
-            for table in soup.find_all('table', attrs={'id': 'players'}):
-                for anchor in table.find_all('a'):
-                    if unicodedata.normalize('NFD', anchor.text).encode('ascii', 'ignore').decode("utf-8") in name:
-                        suffix = anchor.attrs['href']
-                        return suffix
+    with _player_index_lock:
+        return _refresh_player_index(letters)
+
+def _refresh_player_index(letters):
+    global _player_index
+    index = _load_player_index()
+    changed = False
+    responses = fetch_all([f'https://www.basketball-reference.com/players/{letter}' for letter in letters])
+    for letter, r in zip(letters, responses):
+        if r.status_code!=200:
+            continue
+        digest = hashlib.sha1(r.content).hexdigest()
+        if index['pages'].get(letter) == digest:
+            continue
+        index['pages'][letter] = digest
+        index['entries'][letter] = _parse_player_index_page(r.content)
+        changed = True
+    if changed:
+        save_dict({'version': PLAYER_INDEX_VERSION, 'pages': index['pages'], 'entries': index['entries']}, PLAYER_INDEX_NAME)
+        index['names'] = _index_names(index['entries'])
+    _player_index = index
+    return index
+
+def _load_player_index():
+    global _player_index
+    with _player_index_lock:
+        if _player_index is None:
+            _player_index = _read_player_index()
+    return _player_index
+
+def _read_player_index():
+    try:
+        index = load_dict(PLAYER_INDEX_NAME)
+    except (OSError, EOFError, pickle.UnpicklingError):
+        index = {'pages': {}, 'entries': {}}
+    if index.get('version') != PLAYER_INDEX_VERSION:
+        index = {'pages': {}, 'entries': {}}
+    index['names'] = _index_names(index['entries'])
+    return index
+
+def player_index():
+    """Function to get the player index, loaded from disk or built from the /players/{initial} pages if there isn't one yet.
+
+    Returns:
+        the index, see refresh_player_index
+    """
+    index = _load_player_index()
+    if not index['entries']:
+        with _player_index_lock:
+            index = _load_player_index()
+            if not index['entries']:
+                index = _refresh_player_index(PLAYER_INDEX_LETTERS)
+    return index
+
+def _refresh_missed_letters(normalized_name):
+    """Function to refresh the index pages of a name that isn't in the index, once per initial until the fetch ttl has passed again, so a player who debuted after the index was built is found without reading every page on every miss.
+
+    Args:
+        normalized_name (str): the name that missed, already normalized
+
+    Returns:
+        the index, or None if every initial of the name was refreshed too recently
+    """
+    ttl = fetch.settings()['ttl']
+    with _player_index_lock:
+        now = time.time()
+        letters = sorted({token[0] for token in normalized_name.split(' ')[1:] if token[0] in PLAYER_INDEX_LETTERS})
+        letters = ''.join(letter for letter in letters if letter not in _letters_refreshed or now - _letters_refreshed[letter] > ttl)
+        if not letters:
+            return None
+        for letter in letters:
+            _letters_refreshed[letter] = now
+        return _refresh_player_index(letters)
+
+@instrument.timed('player_suffix')
+def get_player_suffix(name, season=None):
+    """
+    Given a name, return the bbref suffix (e.g. '/players/j/jamesle01.html') that allows us to find their information. holy SHIT this took me so long to figure out.
+
+    Lookups go through a prebuilt index of every /players/{initial} page (built the first time it is needed). A name that isn't in it gets the pages of its initials refreshed once (again after the fetch ttl) before falling back to a partial match. When several players share a name, the one who played in the given season wins, and remaining ties go to the lowest suffix, so the answer never depends on page order.
+
+    Args:
+        name (str): Name of the player.
+        season (int): Season the player played in, used to tell apart players with the same name.
+
+    Returns:
+        suffix string, or None if the player isn't found
+    """
+    index = player_index()
+    normalized_name = normalize_name(name)
+    candidates = index['names'].get(normalized_name)
+    if not candidates:
+        #someone who debuted after the index was built isn't in it yet, read their initial's page again before falling back
+        index = _refresh_missed_letters(normalized_name) or index
+        candidates = index['names'].get(normalized_name)
+    if candidates:
+        def rank(candidate):
+            suffix, year_min, year_max = candidate
+            played = season is not None and year_min is not None and year_min <= season <= (year_max or season)
+            return (not played, suffix)
+        return min(candidates, key=rank)[0]
+    #no exact match, fall back to the old rule: first player on a last name's page whose name is contained in ours
+    for last_name in normalized_name.split(' ')[1:]:
+        for norm, suffix, year_min, year_max in index['entries'].get(last_name[0], []):
+            if norm in normalized_name:
+                return suffix
 
 def get_game_logs(name, start_date, end_date, playoffs=False):
     suffix = get_player_suffix(name).replace('/', '%2F').replace('.html', '')
@@ -164,6 +420,7 @@ def get_game_logs(name, start_date, end_date, playoffs=False):
         print(years)
         r = get(f'https://widgets.sports-reference.com/wg.fcgi?css=1&site=bbr&url=%2Fplayers%2Fb%2F{suffix}%2Fgamelog%2F{year}%2F&div={selector}')
         if r.status_code==200:
+            from bs4 import BeautifulSoup #only this old scraper still needs it
             soup = BeautifulSoup(r.content, 'html.parser')
             table = soup.find('table')
             print(table)
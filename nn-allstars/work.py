@@ -1,53 +1,166 @@
+"""
+A module to train the all-star classifier on a dataset made by generate_data.gen_d.
+
+The dataset is memory-mapped (see dataset.load_dataset) and never copied as a whole: the train/validation/test splits are
+arrays of row indices, and tf.data gathers one batch of rows at a time straight out of the memmap, on a background
+thread, while the previous batch trains.
+
+Run it as a script (or `python cli.py train`), e.g. `python work.py 2014_mpg15_g30_playerlist --batch-size 256`, to train and print the
+examples/sec of every epoch. With --export the model is saved for score.py.
+
+Classes:
+    Throughput(batch_size):
+        keras callback that measures training examples per second
+
+Functions:
+    stratified_split(y, fractions=SPLIT, seed=None):
+        will split row indices into train/validation/test keeping the share of all-stars the same in each
+
+    make_dataset(X, y, indices, batch_size=BATCH_SIZE, shuffle=False, seed=None):
+        will return a tf.data pipeline of batches gathered from the dataset rows at the given indices
+
+    build_model():
+        will return the compiled classifier
+
+    train(name='2014_mpg15_g30_playerlist', batch_size=BATCH_SIZE, epochs=5, seed=None):
+        puts it all together, trains and evaluates on the validation split
+
+Todo:
+    * try class weights, there are very few all-stars
+"""
 from __future__ import absolute_import, division, print_function, unicode_literals
 
-import pandas as pd
-import numpy as np
 import math
+import sys
+import time
+
+import numpy as np
+import dataset
 import tensorflow as tf
 
-from tensorflow.keras import layers
-from sklearn.model_selection import train_test_split
-
-X = pd.read_pickle('2014_mpg15_g30_playerlist_data')
-y = X.pop('target')
-
-
-X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.10, stratify = y)
-X_train, X_validation, y_train, y_validation = train_test_split(X_train, y_train, test_size=0.277777, stratify = y_train)
-num_train_examples = len(y_train)
-num_val_examples = len(y_validation)
-num_test_examples = len(y_test)
-
-train = pd.DataFrame(np.hstack((np.asarray(X_train), np.reshape(np.asarray(y_train),(-1,1))  )))
-val = pd.DataFrame(np.hstack((np.asarray(X_validation), np.reshape(np.asarray(y_validation),(-1,1)))))
-test = pd.DataFrame(np.hstack((np.asarray(X_test), np.reshape(np.asarray(y_test),(-1,1)) )))
-
-train_dataset = tf.data.Dataset.from_tensor_slices((
-         tf.cast(train[train.columns[:-1]].values, tf.float32),
-         tf.cast(train[train.columns[-1]].values, tf.int32)))
-validation_dataset = tf.data.Dataset.from_tensor_slices((
-         tf.cast(val[val.columns[:-1]].values, tf.float32),
-         tf.cast(val[val.columns[-1]].values, tf.int32)))
-test_dataset = tf.data.Dataset.from_tensor_slices((
-         tf.cast(test[test.columns[:-1]].values, tf.float32),
-         tf.cast(test[test.columns[-1]].values, tf.int32)))
-
-model = tf.keras.models.Sequential([
-  tf.keras.layers.Dense(128, activation='relu'),
-  tf.keras.layers.Dropout(0.2),
-  tf.keras.layers.Dense(26, activation='relu'),
-  tf.keras.layers.Dropout(0.2),
-  tf.keras.layers.Dense(1)
-])
-
-model.compile(optimizer='adam',
-              loss=tf.keras.losses.BinaryCrossentropy(from_logits=True),
-              metrics=['accuracy'])
-
-BATCH_SIZE = 10
-train_dataset = train_dataset.cache().repeat().shuffle(num_train_examples).batch(BATCH_SIZE)
-validation_dataset = validation_dataset.cache().batch(BATCH_SIZE)
-
-model.fit(train_dataset, epochs=5, steps_per_epoch=math.ceil(num_train_examples/BATCH_SIZE))
-test_loss, test_accuracy = model.evaluate(validation_dataset, steps=math.ceil(num_val_examples/BATCH_SIZE))
-print('Accuracy on validation dataset:', test_accuracy)
+BATCH_SIZE = 128
+SPLIT = (0.65, 0.25, 0.10) #train, validation, test: what the two train_test_split calls used to give
+
+
+def stratified_split(y, fractions=SPLIT, seed=None):
+    """Function to split the rows of a dataset into train/validation/test, every class being split in the same proportions.
+
+    Args:
+        y (array): labels of every row
+        fractions (tuple): share of the rows in each split, adding up to 1
+        seed (int): seed of the shuffle, random if None
+
+    Returns:
+        tuple with one sorted array of row indices per split (sorted so reading them from the memmap goes front to back)
+    """
+    rng = np.random.default_rng(seed)
+    labels = np.asarray(y)
+    splits = [[] for _ in fractions]
+    for label in np.unique(labels):
+        rows = rng.permutation(np.flatnonzero(labels == label))
+        cuts = np.round(np.cumsum(fractions)[:-1]*len(rows)).astype(int)
+        for split, part in zip(splits, np.split(rows, cuts)):
+            split.append(part)
+    return tuple(np.sort(np.concatenate(split)) for split in splits)
+
+
+def make_dataset(X, y, indices, batch_size=BATCH_SIZE, shuffle=False, seed=None):
+    """
+    Will make a tf.data pipeline of (features, label) batches for the rows at indices. Only the indices go through tf.data: every batch of them is turned into rows with one fancy-index read of X (so a memmap only reads those rows), in parallel, and the next batches are prefetched.
+
+    Args:
+        X (array): (rows, width) features, usually a memmap from dataset.load_dataset
+        y (array): labels of every row
+        indices (array): rows to use
+        batch_size (int): rows per batch
+        shuffle (bool): when True, the rows are reshuffled every epoch and the pipeline repeats forever (for training)
+        seed (int): seed of the shuffle
+
+    Returns:
+        tf.data.Dataset of (float32 (batch, width), int32 (batch,)) batches
+    """
+    width = X.shape[1]
+    def gather(batch):
+        batch = np.sort(batch) #front to back in the file
+        return np.asarray(X[batch], dtype=np.float32), np.asarray(y[batch], dtype=np.int32)
+    def load(batch):
+        features, labels = tf.numpy_function(gather, [batch], (tf.float32, tf.int32))
+        return tf.ensure_shape(features, [None, width]), tf.ensure_shape(labels, [None])
+    ds = tf.data.Dataset.from_tensor_slices(np.asarray(indices, dtype=np.int64))
+    if shuffle:
+        ds = ds.shuffle(len(indices), seed=seed, reshuffle_each_iteration=True).repeat()
+    return ds.batch(batch_size).map(load, num_parallel_calls=tf.data.AUTOTUNE).prefetch(tf.data.AUTOTUNE)
+
+
+class Throughput(tf.keras.callbacks.Callback):
+    """
+    Keras callback that times every epoch and reports how many training examples went through per second, in the logs as 'examples_per_sec' and printed.
+
+    Args:
+        batch_size (int): rows per training batch
+    """
+    def __init__(self, batch_size):
+        super().__init__()
+        self.batch_size = batch_size
+        self.examples_per_sec = []
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self._start = time.perf_counter()
+        self._batches = 0
+
+    def on_train_batch_end(self, batch, logs=None):
+        self._batches += 1
+
+    def on_epoch_end(self, epoch, logs=None):
+        rate = self._batches*self.batch_size/(time.perf_counter() - self._start)
+        self.examples_per_sec.append(rate)
+        if logs is not None:
+            logs['examples_per_sec'] = rate
+        print(f'epoch {epoch+1}: {rate:.0f} examples/sec')
+
+
+def build_model():
+    """Function to make the classifier, it outputs logits."""
+    model = tf.keras.models.Sequential([
+      tf.keras.layers.Dense(128, activation='relu'),
+      tf.keras.layers.Dropout(0.2),
+      tf.keras.layers.Dense(26, activation='relu'),
+      tf.keras.layers.Dropout(0.2),
+      tf.keras.layers.Dense(1)
+    ])
+    model.compile(optimizer='adam',
+                  loss=tf.keras.losses.BinaryCrossentropy(from_logits=True),
+                  metrics=['accuracy'])
+    return model
+
+
+def train(name='2014_mpg15_g30_playerlist', batch_size=BATCH_SIZE, epochs=5, seed=None):
+    """
+    Will train the classifier on a dataset and evaluate it on the validation split.
+
+    Args:
+        name (str): dataset name, e.g. '2014_mpg15_g30_playerlist'
+        batch_size (int): rows per batch
+        epochs (int): passes over the training split
+        seed (int): seed of the split and the shuffles, random if None
+
+    Returns:
+        (model, keras history, dictionary with the splits' row indices, the dataset's num_games and pad, the validation loss and accuracy and the examples/sec of every epoch)
+    """
+    X, y, metadata = dataset.load_dataset(name) #memory-mapped, nothing is read until it's used
+    train_rows, validation_rows, test_rows = stratified_split(y, seed=seed)
+    train_dataset = make_dataset(X, y, train_rows, batch_size, shuffle=True, seed=seed)
+    validation_dataset = make_dataset(X, y, validation_rows, batch_size)
+    model = build_model()
+    throughput = Throughput(batch_size)
+    history = model.fit(train_dataset, epochs=epochs, steps_per_epoch=math.ceil(len(train_rows)/batch_size), callbacks=[throughput])
+    validation_loss, validation_accuracy = model.evaluate(validation_dataset)
+    print('Accuracy on validation dataset:', validation_accuracy)
+    report = {'train': train_rows, 'validation': validation_rows, 'test': test_rows, 'num_games': metadata.get('num_games', 30), 'pad': metadata.get('pad'), 'validation_loss': validation_loss,
+              'validation_accuracy': validation_accuracy, 'examples_per_sec': throughput.examples_per_sec}
+    return model, history, report
+
+
+if __name__ == '__main__':
+    import cli
+    cli.main(['train'] + sys.argv[1:])